@@ -7,6 +7,7 @@ from geometry_msgs.msg import PoseStamped, Pose, Point, Quaternion
 from nav_msgs.msg import Path
 
 import robpath.polyline as dxf2path
+from robpath.toolpath import as_toolpath
 
 
 def talker():
@@ -24,11 +25,12 @@ def talker():
         
     layers = dxf2path.read_layers(rospkg.RosPack().get_path('etna_planning') + '/src/robpath/models_dxf/curvas_v16.dxf') 
     points1, frames1 = dxf2path.get_vectors(layers['Copa1_I'], layers['Copa1_E'])
-    cut_path = dxf2path.frames2path(points1, frames1)
+    cut_path = as_toolpath(dxf2path.frames2path(points1, frames1))
+    positions = cut_path.positions / 1000
+    orientations = cut_path.orientations
     
-    for cut_pose in cut_path:
-        (x, y, z), (q0, q1, q2, q3), proc = cut_pose
-        path.poses.append(PoseStamped(pose=Pose(Point(x/1000, y/1000, z/1000), Quaternion(q0, q1, q2, q3))))
+    for (x, y, z), (q0, q1, q2, q3) in zip(positions, orientations):
+        path.poses.append(PoseStamped(pose=Pose(Point(x, y, z), Quaternion(q0, q1, q2, q3))))
     
     pub_path.publish(path)
     rospy.sleep(2.0)
@@ -36,10 +38,10 @@ def talker():
     k = 0
     N = len(cut_path)
     while not rospy.is_shutdown() and (k < N):
-        (x, y, z), (q0, q1, q2, q3), proc = cut_path[k]
+        (x, y, z), (q0, q1, q2, q3) = positions[k], orientations[k]
         rospy.loginfo("%s, %s" %(cut_path[k], rospy.get_time()))
         pose = PoseStamped(Header(frame_id='workobject'), 
-                           Pose(Point(x/1000, y/1000, z/1000),
+                           Pose(Point(x, y, z),
                                 Quaternion(q0, q1, q2, q3)))
         pub_pose.publish(pose)
         k = k + 1
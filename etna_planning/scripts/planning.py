@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import time
+
+try:
+    from python_qt_binding import QtCore
+except ImportError:
+    from pyface.qt import QtCore
+
+
+class PlanningWorker(QtCore.QThread):
+    """Plans the RobPath layers in a background thread.
+
+    Each layer is sent with its slice, tool path and planning time when it
+    is done, so the window keeps responding while the next one is sliced.
+    Planning is cancelled while the layer is ordered, so cancel returns
+    quickly, and restarted with the current parameters of the RobPath,
+    which must not change while it runs. The signals carry the run number,
+    as the ones queued by a cancelled run can arrive after the next run is
+    started.
+    """
+    layer = QtCore.Signal(int, int, object, object, float)
+    progress = QtCore.Signal(int, float)
+    done = QtCore.Signal(int, float, bool)
+
+    def __init__(self, robpath, parent=None):
+        super(PlanningWorker, self).__init__(parent)
+        self.robpath = robpath
+        self.filled = True
+        self.cancelled = False
+        self.run_id = 0
+
+    def plan(self, filled=True):
+        """Starts planning the layers, cancelling the running planning."""
+        self.cancel()
+        self.filled = filled
+        self.cancelled = False
+        self.run_id += 1
+        self.start()
+
+    def cancel(self):
+        """Stops planning in the current layer and waits for it."""
+        self.cancelled = True
+        self.wait()
+
+    def isCancelled(self):
+        return self.cancelled
+
+    def run(self):
+        run_id = self.run_id
+        t0 = time.time()
+        n_levels = len(self.robpath.get_levels())
+        layers = self.robpath.iter_layer_paths(self.filled,
+                                               self.isCancelled)
+        try:
+            t1 = time.time()
+            for k, slice, tool_path in layers:
+                if self.cancelled:
+                    break
+                t2 = time.time()
+                self.layer.emit(run_id, k, slice, tool_path, t2 - t1)
+                self.progress.emit(run_id, 100.0 * (k + 1) / n_levels)
+                t1 = t2
+        finally:
+            layers.close()
+        self.done.emit(run_id, time.time() - t0, self.cancelled)
@@ -21,6 +21,7 @@ import numpy as np
 
 from robpath.robpath import RobPath
 from robpath.mlabplot import MPlot3D
+from planning import PlanningWorker
 
 
 class Visualization(HasTraits):
@@ -103,19 +104,25 @@ class RobPathUI(QtGui.QMainWindow):
         self.btnQuit.clicked.connect(self.btnQuitClicked)
 
         self.processing = False
-        self.timer = QtCore.QTimer(self.plot)
-        self.timer.timeout.connect(self.updateProcess)
-
         self.robpath = RobPath()
 
+        self.worker = PlanningWorker(self.robpath)
+        self.worker.layer.connect(self.updateLayer)
+        self.worker.progress.connect(self.updateProgress)
+        self.worker.done.connect(self.processDone)
+
     def changePosition(self):
+        self.worker.cancel()
         x = self.sbPositionX.value()
         y = self.sbPositionY.value()
         z = self.sbPositionZ.value()
         self.robpath.translate_mesh(np.float32([x, y, z]))
         self.plot.drawMesh(self.robpath.mesh)
+        if self.processing:
+            self.startProcess()
 
     def changeSize(self):
+        self.worker.cancel()
         sx = self.sbSizeX.value() + 0.001
         sy = self.sbSizeY.value() + 0.001
         sz = self.sbSizeZ.value() + 0.001
@@ -134,17 +141,24 @@ class RobPathUI(QtGui.QMainWindow):
         self.sbSizeY.setValue(sy)
         self.sbSizeZ.setValue(sz)
 
-    def updateProcess(self):
-        if self.robpath.k < len(self.robpath.levels):
-            self.robpath.update_process()
+    def updateLayer(self, run_id, k, slice, tool_path, duration):
+        if run_id == self.worker.run_id:
+            self.robpath.add_layer(k, slice, tool_path)
             #self.plot.drawSlice(self.robpath.slices, self.robpath.path)
-            self.plot.drawPath(self.robpath.path)
-            self.plot.progress.setValue(100.0 * self.robpath.k / len(self.robpath.levels))
-            self.btnSaveRapid.setEnabled(False)
-        else:
+            if len(tool_path) > 1:
+                self.plot.drawPath(tool_path)
+            print 'Layer %i: %i points in %.3f s' % (k, len(tool_path),
+                                                     duration)
+
+    def updateProgress(self, run_id, progress):
+        if run_id == self.worker.run_id:
+            self.plot.progress.setValue(int(progress))
+
+    def processDone(self, run_id, duration, cancelled):
+        if run_id == self.worker.run_id and not cancelled:
             self.processing = False
-            self.timer.stop()
             self.btnSaveRapid.setEnabled(True)
+            print 'Time to plan: %.3f s' % duration
 
     def blockSignals(self, value):
         self.sbPositionX.blockSignals(value)
@@ -195,18 +209,23 @@ class RobPathUI(QtGui.QMainWindow):
         turntable = self.sbTurntable.value()
         self.robpath.set_powder(carrier_gas, stirrer, turntable)
 
+    def startProcess(self):
+        self.worker.cancel()
+        self.plot.drawWorkingArea()
+
+        self.update_parameters()
+        self.robpath.init_process()
+
+        self.processing = True
+        self.btnSaveRapid.setEnabled(False)
+        self.worker.plan(self.robpath.filled)
+
     def __process_shape(self):
         if self.processing:
-            self.timer.stop()
+            self.worker.cancel()
             self.processing = False
         else:
-            self.plot.drawWorkingArea()
-
-            self.update_parameters()
-            self.robpath.init_process()
-
-            self.processing = True
-            self.timer.start(100)
+            self.startProcess()
 
     def btnProcessMeshClicked(self):
         self.robpath.filled = True
@@ -227,6 +246,7 @@ class RobPathUI(QtGui.QMainWindow):
         QtGui.QMessageBox.information(self, "Export information", "Routine exported to the robot.")
 
     def btnQuitClicked(self):
+        self.worker.cancel()
         QtCore.QCoreApplication.instance().quit()
 
 
@@ -21,6 +21,7 @@ from sensor_msgs.msg import PointCloud2, PointField
 
 from markers import MeshMarker, TriangleListMarker
 from robpath import RobPath
+from planning import PlanningWorker
 
 
 class MyViz(QtGui.QWidget):
@@ -146,17 +147,18 @@ class RobPathUI(QtGui.QMainWindow):
         #rospy.spin()
 
         self.processing = False
-        self.timer = QtCore.QTimer(self.boxPlot)
-        self.timer.timeout.connect(self.updateProcess)
-
         self.robpath = RobPath()
 
+        self.worker = PlanningWorker(self.robpath)
+        self.worker.layer.connect(self.updateLayer)
+        self.worker.done.connect(self.processDone)
+
     def changeSpeed(self):
-        speed = self.Window.sbSpeed.value()
+        speed = self.sbSpeed.value()
         self.robpath.set_speed(speed)
 
     def changePower(self):
-        power = self.Window.sbPower.value()
+        power = self.sbPower.value()
         self.robpath.set_power(power)
 
     def updatePosition(self, position):
@@ -171,14 +173,17 @@ class RobPathUI(QtGui.QMainWindow):
         self.sbSizeY.setValue(sy)
         self.sbSizeZ.setValue(sz)
 
-    def updateProcess(self):
-        if self.robpath.k < len(self.robpath.levels):
-            self.robpath.update_process()
+    def updateLayer(self, run_id, k, slice, tool_path, duration):
+        if run_id == self.worker.run_id:
+            self.robpath.add_layer(k, slice, tool_path)
             #self.plot.drawSlice(self.robpath.slices, self.robpath.path)
-            #self.plot.progress.setValue(100.0 * self.robpath.k / len(self.robpath.levels))
-        else:
+            rospy.loginfo('Layer %i: %i points in %.3f s' % (k, len(tool_path),
+                                                            duration))
+
+    def processDone(self, run_id, duration, cancelled):
+        if run_id == self.worker.run_id and not cancelled:
             self.processing = False
-            self.timer.stop()
+            rospy.loginfo('Time to plan: %.3f s' % duration)
 
     def blockSignals(self, value):
         self.sbPositionX.blockSignals(value)
@@ -201,7 +206,7 @@ class RobPathUI(QtGui.QMainWindow):
 
         #self.marker = MeshMarker(mesh_resource="file://"+filename, frame_id="/workobject")
         self.marker = TriangleListMarker(frame_id="/workobject")
-        self.marker.set_points(0.001 * np.vstack(self.robpath.mesh.triangles))
+        self.marker.set_points(0.001 * self.robpath.mesh.get_points())
         self.marker.set_color((0.75,0.25,0.25,0.5))
 #        #rospy.loginfo()
 #        self.marker.set_position((0, 0, 0))
@@ -220,14 +225,6 @@ class RobPathUI(QtGui.QMainWindow):
 
         self.blockSignals(False)
 
-    def btnProcessMeshClicked(self):
-        if self.processing:
-            self.processing = False
-            self.timer.stop()
-        else:
-            self.processing = True
-            self.timer.start(100)
-
     def point_cloud_to_world(self, stamp, points3d):
         """Transforms the point cloud in camera coordinates to the world frame."""
         self.listener.waitForTransform("/world", "/camera0", stamp, rospy.Duration(1.0))
@@ -275,6 +272,8 @@ class RobPathUI(QtGui.QMainWindow):
         self.publisher.publish(self.marker.marker)
 
     def changeSize(self):
+        self.worker.cancel()
+        self.processing = False
         sx = self.sbSizeX.value()
         sy = self.sbSizeY.value()
         sz = self.sbSizeZ.value()
@@ -284,20 +283,18 @@ class RobPathUI(QtGui.QMainWindow):
 
     def btnProcessMeshClicked(self):
         if self.processing:
+            self.worker.cancel()
             self.processing = False
-            self.timer.stop()
         else:
-            height = self.Window.sbHeight.value()
-            width = self.Window.sbWidth.value()
-            overlap = 0.01 * self.Window.sbOverlap.value()
+            height = self.sbHeight.value()
+            width = self.sbWidth.value()
+            overlap = 0.01 * self.sbOverlap.value()
             self.robpath.set_track(height, width, overlap)
 
-            self.plot.drawWorkingArea()
-
             self.robpath.init_process()
 
             self.processing = True
-            self.timer.start(100)
+            self.worker.plan(self.robpath.filled)
 
     def btnSaveRapidClicked(self):
         #filename = QtGui.QFileDialog.getOpenFileName(self.plot, 'Save file', './',
@@ -305,6 +302,7 @@ class RobPathUI(QtGui.QMainWindow):
         self.robpath.save_rapid()
 
     def btnQuitClicked(self):
+        self.worker.cancel()
         QtCore.QCoreApplication.instance().quit()
 
 
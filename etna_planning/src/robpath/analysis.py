@@ -0,0 +1,122 @@
+import numpy as np
+
+
+STATISTICS_DTYPE = np.dtype([('layer', np.int32),
+                             ('process_length', np.float64),
+                             ('travel_length', np.float64),
+                             ('process_segments', np.int64),
+                             ('travel_segments', np.int64),
+                             ('switches', np.int64),
+                             ('process_time', np.float64),
+                             ('travel_time', np.float64),
+                             ('time', np.float64)])
+
+
+def get_robot_speeds(robot):
+    """Returns the process and travel speeds (mm/s) of the RAPID module.
+
+    The process speed data is defined with the track speed, and the travel
+    speed is a standard speed data (v50 is 50 mm/s).
+    """
+    speeds = {robot.speed: robot.track_speed}
+    travel_speed = speeds.get(robot.travel_speed, robot.travel_speed[1:])
+    return float(robot.track_speed), float(travel_speed)
+
+
+def get_move_times(lengths, speeds, acceleration):
+    """Calculates an upper bound of the time of the moves.
+
+    Each move follows a trapezoidal speed profile starting and stopping at
+    rest, so the moves shorter than the acceleration and braking distance
+    never reach their speed. The z0 zone is a fly-by point, so the robot
+    can keep some speed through the targets and take less time.
+    """
+    ramps = speeds * speeds / acceleration
+    return np.where(lengths >= ramps, lengths / speeds + speeds / acceleration,
+                    2 * np.sqrt(lengths / acceleration))
+
+
+def get_path_statistics(path, process_speed, travel_speed, acceleration=500.0):
+    """Calculates the deposition statistics of each layer of the tool path.
+
+    The moves to the process points deposit with the laser on at the
+    process speed, and the moves to the other points travel, as the RAPID
+    modules run them, whatever the speeds of the points. The times are an
+    upper bound, see get_move_times. The laser switches on and off once
+    for each deposition run. Returns a record for each layer, sorted by
+    layer, in a STATISTICS_DTYPE array.
+    """
+    positions, processes = path.positions, path.processes
+    layer_values, layers = np.unique(path.layers, return_inverse=True)
+    statistics = np.zeros(len(layer_values), dtype=STATISTICS_DTYPE)
+    statistics['layer'] = layer_values
+    if len(path) < 2:
+        return statistics
+    vectors = positions[1:] - positions[:-1]
+    lengths = np.sqrt(np.sum(vectors * vectors, axis=1))
+    processes, layers = processes[1:], layers[1:]
+    travels = np.logical_not(processes)
+    speeds = np.where(processes, process_speed, travel_speed)
+    times = get_move_times(lengths, speeds, acceleration)
+    # Last move of each deposition run
+    ends = processes & np.logical_not(np.append(processes[1:], False))
+    n_layers = len(layer_values)
+    statistics['process_length'] = np.bincount(layers, lengths * processes,
+                                               n_layers)
+    statistics['travel_length'] = np.bincount(layers, lengths * travels,
+                                              n_layers)
+    statistics['process_segments'] = np.bincount(layers, processes, n_layers)
+    statistics['travel_segments'] = np.bincount(layers, travels, n_layers)
+    statistics['switches'] = 2 * np.bincount(layers, ends, n_layers)
+    statistics['process_time'] = np.bincount(layers, times * processes,
+                                             n_layers)
+    statistics['travel_time'] = np.bincount(layers, times * travels, n_layers)
+    statistics['time'] = statistics['process_time'] + statistics['travel_time']
+    return statistics
+
+
+def get_total_statistics(statistics):
+    """Sums the statistics of the layers, with -1 as layer index."""
+    total = np.zeros(1, dtype=STATISTICS_DTYPE)
+    for name in STATISTICS_DTYPE.names[1:]:
+        total[name] = np.sum(statistics[name])
+    total['layer'] = -1
+    return total[0]
+
+
+def print_statistics(statistics):
+    """Prints the statistics of the layers and the whole job."""
+    print 'Layer  Laser on (mm)  Travel (mm)  Segments  Switches  Time (s)'
+    for stats in statistics:
+        print '%5i  %13.1f  %11.1f  %8i  %8i  %8.1f' % (
+            stats['layer'], stats['process_length'], stats['travel_length'],
+            stats['process_segments'] + stats['travel_segments'],
+            stats['switches'], stats['time'])
+    total = get_total_statistics(statistics)
+    print 'Laser on: %.1f mm in %.1f s' % (total['process_length'],
+                                           total['process_time'])
+    print 'Travel: %.1f mm in %.1f s' % (total['travel_length'],
+                                         total['travel_time'])
+    print 'Segments: %i process, %i travel' % (total['process_segments'],
+                                               total['travel_segments'])
+    print 'Laser switches:', total['switches']
+    print 'Cycle time (upper bound): %.1f min' % (total['time'] / 60)
+
+
+if __name__ == '__main__':
+    import sys
+    from robpath import RobPath
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/flange.stl'
+
+    robpath = RobPath()
+    robpath.load_mesh(filename)
+    robpath.set_track(1.0, 2.5, 0.3)
+    for ordered in [False, True]:
+        robpath.set_ordering(ordered)
+        robpath.get_contours_path()
+        print 'Ordered:', ordered
+        print_statistics(robpath.get_statistics())
@@ -0,0 +1,152 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+
+from collections import OrderedDict
+
+
+CACHE_VERSION = 1
+
+
+def get_nbytes(value):
+    """Returns the size of the arrays in the (nested) lists."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum([get_nbytes(item) for item in value])
+    return 0
+
+
+class MeshCache():
+    """Disk cache of preprocessed mesh arrays keyed by the STL content hash.
+
+    Each entry is a directory of .npy files loaded as memory maps. Entries
+    of modified files are never hit again, because the key changes, and the
+    least recently used entries are evicted over the size limit.
+    """
+    def __init__(self, directory=None, max_size=1073741824):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.robpath',
+                                     'cache')
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, filename, block_size=1048576):
+        """Returns the hash of the file content."""
+        sha1 = hashlib.sha1('robpath-cache-%i' % CACHE_VERSION)
+        with open(filename, 'rb') as f:
+            data = f.read(block_size)
+            while data:
+                sha1.update(data)
+                data = f.read(block_size)
+        return sha1.hexdigest()
+
+    def _get_filename(self, key, name):
+        return os.path.join(self.directory, key, '%s.npy' % name)
+
+    def load(self, key, name):
+        """Returns the copy-on-write memory map of the array, or None."""
+        filename = self._get_filename(key, name)
+        if not os.path.exists(filename):
+            return None
+        array = np.load(filename, mmap_mode='c')
+        os.utime(os.path.dirname(filename), None)  # Last access for LRU
+        return array
+
+    def save(self, key, name, array):
+        """Stores the array in the entry and evicts the old entries."""
+        filename = self._get_filename(key, name)
+        directory = os.path.dirname(filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_filename = '%s.%i.tmp' % (filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.rename(tmp_filename, filename)
+        os.utime(directory, None)
+        self.evict(keep=key)
+
+    def get_entries(self):
+        """Returns the (last access, size, key) of each entry."""
+        entries = []
+        if os.path.exists(self.directory):
+            for key in os.listdir(self.directory):
+                directory = os.path.join(self.directory, key)
+                if os.path.isdir(directory):
+                    size = sum([os.path.getsize(os.path.join(directory, name))
+                                for name in os.listdir(directory)])
+                    entries.append((os.path.getmtime(directory), size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries over the size limit."""
+        entries = self.get_entries()
+        total_size = sum([size for atime, size, key in entries])
+        for atime, size, key in entries:
+            if total_size <= self.max_size:
+                break
+            if key != keep:
+                shutil.rmtree(os.path.join(self.directory, key),
+                              ignore_errors=True)
+                total_size -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SliceCache():
+    """Memory cache of slices with least recently used eviction.
+
+    Slices are stored as given, in mesh local coordinates, and their
+    memory footprint is limited to the maximum size in bytes. Lists of
+    slices, like the contour offsets of a layer, can be stored too.
+    """
+    def __init__(self, max_size=268435456):
+        self.max_size = max_size
+        self.size = 0
+        self.slices = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.slices
+
+    def __len__(self):
+        return len(self.slices)
+
+    def __getitem__(self, key):
+        slice, size = self.slices.pop(key)
+        self.slices[key] = (slice, size)  # Most recently used
+        return slice
+
+    def __setitem__(self, key, slice):
+        if key in self.slices:
+            self.size -= self.slices.pop(key)[1]
+        size = 64 + get_nbytes(slice)
+        self.slices[key] = (slice, size)
+        self.size += size
+        while self.size > self.max_size and len(self.slices) > 1:
+            self.size -= self.slices.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.slices.clear()
+        self.size = 0
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from mesh import Mesh
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/ducky.stl'
+
+    cache = MeshCache()
+    t0 = time.time()
+    mesh = Mesh(filename, cache=cache)
+    t1 = time.time()
+    mesh = Mesh(filename, cache=cache)
+    t2 = time.time()
+    print 'Time to load: %.3f s (cached %.3f s)' % (t1 - t0, t2 - t1)
+    print 'Cache entries:', cache.get_entries()
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from toolpath import as_toolpath, iter_parts
+
+
+# Robot attributes written in the part modules
+PART_ATTRIBUTES = ['speed', 'zone', 'travel_speed', 'travel_zone', 'config']
+
+
+def get_layer_fingerprint(path):
+    """Returns the SHA-1 of the point columns written in the RAPID modules.
+
+    The positions, orientations and process flags are hashed, but not the
+    speeds and powers of the points, as the modules use the robot ones.
+    """
+    path = as_toolpath(path)
+    sha1 = hashlib.sha1()
+    for column in [path.positions, path.orientations, path.processes]:
+        sha1.update(np.ascontiguousarray(column).tostring())
+    return sha1.hexdigest()
+
+
+def get_robot_fingerprint(robot):
+    """Returns the SHA-1 of the process parameters of the robot.
+
+    Every number, string and list attribute is included, so changing the
+    power, the speeds, the powder or the tool changes it.
+    """
+    values = sorted([(key, value) for key, value in vars(robot).items()
+                     if isinstance(value, (int, float, str, list, tuple))])
+    return hashlib.sha1(repr(values)).hexdigest()
+
+
+def get_part_fingerprint(robot):
+    """Returns the SHA-1 of the robot attributes written in part modules.
+
+    Part modules only name the speeds and zones of the moves and have the
+    configuration of the targets, the process parameters are only written
+    in the main module.
+    """
+    values = [(key, getattr(robot, key)) for key in PART_ATTRIBUTES]
+    return hashlib.sha1(repr(values)).hexdigest()
+
+
+def get_fingerprint(*fingerprints):
+    return hashlib.sha1('\n'.join(fingerprints)).hexdigest()
+
+
+def get_manifest_name(filename):
+    """Returns the manifest filename beside the main module."""
+    return os.path.splitext(filename)[0] + '.json'
+
+
+def load_manifest(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(filename, manifest):
+    with open(filename, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def write_modules(robot, filename, paths):
+    """Writes the RAPID modules of the paths whose fingerprint changed.
+
+    The paths are written in the main module, or split in part modules
+    loaded by it when they have more than the max targets of the robot.
+    The fingerprint of each module is made of the robot one and the layer
+    ones of its paths, only with the robot attributes written in them for
+    the part modules, and the module is only written again when it
+    differs from the manifest beside the main module, or the file is
+    missing. Returns the filenames of the modules, the changed ones and
+    the new manifest, to be saved when they are uploaded.
+    """
+    paths = [as_toolpath(path) for path in paths]
+    manifest = load_manifest(get_manifest_name(filename))
+    modules = manifest.get('modules', {})
+    directory = os.path.dirname(filename)
+    robot_fingerprint = get_robot_fingerprint(robot)
+    part_fingerprint = get_part_fingerprint(robot)
+    layers = [get_layer_fingerprint(path) for path in paths]
+    main_name = os.path.basename(filename)
+    filenames, changed, fingerprints = [filename], [], {}
+    if sum([len(path) for path in paths]) > robot.max_targets:
+        parts = list(iter_parts(paths, robot.max_targets))
+        for k, part in enumerate(parts):
+            name = 'EtnaPart%i.mod' % (k + 1)
+            filenames.append(os.path.join(directory, name))
+            fingerprints[name] = get_fingerprint(
+                part_fingerprint, *[get_layer_fingerprint(piece)
+                                    for piece in part])
+            if (modules.get(name) != fingerprints[name] or
+                    not os.path.exists(filenames[-1])):
+                robot.write_part(filenames[-1], part, k + 1)
+                changed.append(filenames[-1])
+        fingerprints[main_name] = get_fingerprint(robot_fingerprint,
+                                                  'parts %i' % len(parts))
+        if (modules.get(main_name) != fingerprints[main_name] or
+                not os.path.exists(filename)):
+            robot.write_main(filename, len(parts))
+            changed.insert(0, filename)
+    else:
+        fingerprints[main_name] = get_fingerprint(robot_fingerprint, *layers)
+        if (modules.get(main_name) != fingerprints[main_name] or
+                not os.path.exists(filename)):
+            with open(filename, 'w') as f:
+                robot.write_module(f, paths)
+            changed.append(filename)
+    manifest = {'robot': robot_fingerprint, 'layers': layers,
+                'modules': fingerprints}
+    return filenames, changed, manifest
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import tempfile
+    from robpath import RobPath
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/flange.stl'
+
+    robpath = RobPath()
+    robpath.load_mesh(filename)
+    robpath.set_track(0.5, 2.5, 0.3)
+    robpath.get_contours_path()
+    robot = robpath.rob_parser
+    robot.max_targets = 5000
+    filename = os.path.join(tempfile.mkdtemp(), 'etna.mod')
+
+    for change in ['first', 'same', 'layer', 'power']:
+        layers = robpath.path.split_layers()
+        if change == 'layer':
+            layers[-1].positions[:, 2] += 0.1
+        if change == 'power':
+            robot.power = 1500
+        t0 = time.time()
+        filenames, changed, manifest = write_modules(robot, filename, layers)
+        t1 = time.time()
+        save_manifest(get_manifest_name(filename), manifest)
+        print '%s: %i of %i modules written in %.3f s' % (
+            change, len(changed), len(filenames), t1 - t0)
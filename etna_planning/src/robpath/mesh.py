@@ -1,29 +1,346 @@
-import re
+import os
 import time
+import shutil
 import struct
+import hashlib
+import tempfile
+import multiprocessing
 import numpy as np
 
-import calculate as calc
+from toolpath import ToolPath
 
 
-def filter_polyline(points, dist=0.1, angl=0.01):
-    if len(points) > 3:
-        pnts = [points[0]]
-        ang_min, ang_max = np.pi - angl, np.pi + angl
-        for k in range(len(points)):
-            point1, point2, point3 = pnts[-1], points[k-1], points[k]
-            d12 = calc.distance2(point1, point2)
-            #d23 = calc.distance2(point2, point3)
-            if d12 <= dist:
+def simplify_polyline(points, tolerance=0.01):
+    """Simplifies the polyline with the Ramer-Douglas-Peucker algorithm.
+
+    Points closer than the chordal tolerance (in mm) to the chord between
+    the kept points are removed. All the ranges of a recursion level are
+    split at once, and closed polylines are first split at the farthest
+    point from their start.
+    """
+    n_points = len(points)
+    if n_points < 3:
+        return points
+    keep = np.zeros(n_points, dtype=np.bool_)
+    keep[0] = keep[-1] = True
+    starts, ends = np.array([0]), np.array([n_points - 1])
+    while len(starts):
+        counts = ends - starts - 1
+        ranges = np.flatnonzero(counts > 0)
+        if len(ranges) == 0:
+            break
+        starts, ends, counts = starts[ranges], ends[ranges], counts[ranges]
+        # Inner points of each range
+        firsts = np.cumsum(counts) - counts
+        ids = np.repeat(np.arange(len(starts)), counts)
+        indexes = np.arange(np.sum(counts)) - firsts[ids] + starts[ids] + 1
+        pnts1, pnts2 = points[starts[ids]], points[ends[ids]]
+        chords, vectors = pnts2 - pnts1, points[indexes] - pnts1
+        lengths2 = np.sum(chords * chords, axis=1)
+        params = np.sum(vectors * chords, axis=1) / np.maximum(lengths2,
+                                                                1e-24)
+        vectors -= np.clip(params, 0, 1).reshape((-1, 1)) * chords
+        distances2 = np.sum(vectors * vectors, axis=1)
+        # First farthest point of each range
+        maxima = np.maximum.reduceat(distances2, firsts)
+        farthest = np.flatnonzero(distances2 == maxima[ids])
+        ranges, firsts = np.unique(ids[farthest], return_index=True)
+        farthest = farthest[firsts]
+        split = maxima[ranges] > tolerance * tolerance
+        ranges, splits = ranges[split], indexes[farthest[split]]
+        keep[splits] = True
+        starts = np.concatenate((starts[ranges], splits))
+        ends = np.concatenate((splits, ends[ranges]))
+    return points[keep]
+
+
+# Binary STL: 80 bytes header, facets count and 50 bytes records
+STL_HEADER_SIZE = 84
+STL_RECORD = np.dtype([('normal', '<f4', (3,)),
+                       ('vertices', '<f4', (3, 3)),
+                       ('attribute', '<u2')])
+
+
+def is_binary_stl(filename):
+    """Returns True when the file is a binary STL.
+
+    The file is binary when its size matches the facets count of the
+    header, and otherwise when the header does not start with 'solid'.
+    """
+    try:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as f:
+            header = f.read(STL_HEADER_SIZE)
+    except (IOError, OSError):
+        return False
+    if size < STL_HEADER_SIZE:
+        return False
+    n_facets = struct.unpack('<I', header[80:84])[0]
+    if size == STL_HEADER_SIZE + n_facets * STL_RECORD.itemsize:
+        return True
+    return not header.lstrip().startswith('solid')
+
+
+def read_binary_stl(filename):
+    """Reads the binary STL triangles as a (N, 3, 3) float32 array.
+
+    The file is memory mapped and its records are copied in a single pass,
+    raising IOError when the header or the records are truncated. When the
+    header count is 0, the count is taken from the file size.
+    """
+    size = os.path.getsize(filename)
+    if size < STL_HEADER_SIZE:
+        raise IOError('Truncated STL header (%i bytes)' % size)
+    with open(filename, 'rb') as f:
+        header = f.read(STL_HEADER_SIZE)
+    n_facets = struct.unpack('<I', header[80:84])[0]
+    n_records = (size - STL_HEADER_SIZE) // STL_RECORD.itemsize
+    if n_facets == 0:
+        n_facets = n_records
+    if n_facets == 0:
+        raise IOError('Empty STL file')
+    if n_facets > n_records:
+        raise IOError('Truncated STL file (%i of %i facets)' % (n_records,
+                                                               n_facets))
+    records = np.memmap(filename, dtype=STL_RECORD, mode='r',
+                        offset=STL_HEADER_SIZE, shape=(n_facets,))
+    triangles = np.array(records['vertices'], dtype=np.float32)
+    del records
+    return triangles
+
+
+def read_text_stl(filename, chunk_size=1048576):
+    """Reads the ASCII STL triangles as a (N, 3, 3) float64 array.
+
+    The file is streamed in chunks of whole lines, whose vertex coordinates
+    are parsed in bulk into a preallocated array that doubles its capacity.
+    """
+    vertices = np.empty((3072, 3))
+    n_vertices = 0
+    with open(filename, 'rb') as f:
+        rest = f.read(chunk_size)
+        if not rest.lstrip().startswith('solid'):
+            raise ValueError('Not an ASCII STL file')
+        while rest:
+            data = f.read(chunk_size)
+            end = rest.rfind('\n') + 1 if data else len(rest)
+            chunk, rest = rest[:end], rest[end:] + data
+            lines = [line for line in chunk.split('\n')
+                     if 'vertex' in line and 'solid' not in line]
+            if not lines:
                 continue
+            values = np.fromstring(' '.join(lines).replace('vertex', ' '),
+                                   sep=' ')
+            if len(values) != 3 * len(lines):
+                raise ValueError('Invalid vertex line in ASCII STL file')
+            coordinates = values.reshape((-1, 3))
+            while n_vertices + len(coordinates) > len(vertices):
+                vertices = np.resize(vertices, (2 * len(vertices), 3))
+            vertices[n_vertices:n_vertices + len(coordinates)] = coordinates
+            n_vertices += len(coordinates)
+    if n_vertices == 0 or n_vertices % 3:
+        raise ValueError('Invalid number of vertices (%i)' % n_vertices)
+    return vertices[:n_vertices].reshape((-1, 3, 3))
+
+
+def weld_vertices(triangles, tolerance=1e-4):
+    """Welds the coincident vertices of a (N, 3, 3) triangles array.
+
+    Vertices are hashed on a grid quantized by tolerance, returning the
+    (V, 3) shared vertices and the (N, 3) int32 faces indexing them.
+    """
+    points = triangles.reshape((-1, 3))
+    keys = np.ascontiguousarray(np.round(points / tolerance).astype(np.int64))
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    vertices = points[first]
+    faces = inverse.reshape((-1, 3)).astype(np.int32)
+    return vertices, faces
+
+
+def get_edge_faces(faces):
+    """Calculates the edge to face adjacency table of an indexed mesh.
+
+    Returns the (E, 2) edges, as sorted vertex indexes, and the (E, 2)
+    faces sharing each edge, with -1 for border edges. Non-manifold edges
+    only keep the first and the last face found.
+    """
+    n_faces = len(faces)
+    edges = np.vstack((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+    edges = np.sort(edges, axis=1).astype(np.int64)
+    face_ids = np.tile(np.arange(n_faces, dtype=np.int32), 3)
+    keys = edges[:, 0] * (np.max(faces) + 1) + edges[:, 1]
+    order = np.argsort(keys, kind='mergesort')
+    keys, edges, face_ids = keys[order], edges[order], face_ids[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    edge_faces = np.column_stack((face_ids[starts], face_ids[ends]))
+    edge_faces[starts == ends, 1] = -1
+    return edges[starts].astype(np.int32), edge_faces
+
+
+def get_z_intersects(triangles, z_level, faces=None):
+    """Gets the intersection lines of the triangles with the plane in Z.
+
+    Triangles must have their vertices sorted by Z and span the plane
+    (z1 <= z_level < z3). Vertices lying on the plane are taken as below
+    it, so edges on the plane are returned once and triangles touching
+    the plane only in a vertex are discarded. Returns a (K, 2, 3) array,
+    and the (K, 2) mesh edge keys of the end points when the faces of the
+    indexed mesh are given.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    point1, point2, point3 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    upper = (point2[:, 2] > z_level).reshape((-1, 1))
+    point_b1 = np.where(upper, point1, point2)  # Edge 1-2 or edge 2-3
+    point_b2 = np.where(upper, point2, point3)
+    segments = np.empty((len(triangles), 2, 3))
+    params = np.empty((len(triangles), 2))
+    for k, (point_1, point_2) in enumerate([(point1, point3),
+                                            (point_b1, point_b2)]):
+        t = (z_level - point_1[:, 2]) / (point_2[:, 2] - point_1[:, 2])
+        segments[:, k] = point_1 + t.reshape((-1, 1)) * (point_2 - point_1)
+        params[:, k] = t
+    segments[:, :, 2] = z_level
+    valid = ~((point1[:, 2] == z_level) & upper[:, 0])
+    if faces is None:
+        return segments[valid]
+    # Points are identified by the mesh edge, or the vertex on the plane
+    faces = np.int64(faces)
+    vertex1 = np.column_stack((faces[:, 0], np.where(upper[:, 0], faces[:, 0],
+                                                     faces[:, 1])))
+    vertex2 = np.column_stack((faces[:, 2], np.where(upper[:, 0], faces[:, 1],
+                                                     faces[:, 2])))
+    vertex2 = np.where(params == 0, vertex1, vertex2)
+    keys = (vertex1 << 32) | vertex2
+    return segments[valid], keys[valid]
+
+
+def chain_segments(segments, keys=None, tolerance=1e-5):
+    """Stitches the (K, 2, 3) segments sharing end points in polylines.
+
+    End points are matched by their (K, 2) keys, the mesh edge of each
+    point when available, or hashing their coordinates quantized by the
+    tolerance. Returns the closed polygons, which repeat the first point
+    at the end, and the open chains left.
+    """
+    points = segments.reshape((-1, 3))
+    if not len(points):
+        return [], []
+    if keys is None:
+        keys = np.ascontiguousarray(np.round(points / tolerance).astype(np.int64))
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3)))
+    _, nodes = np.unique(np.ravel(keys), return_inverse=True)
+    nodes = nodes.reshape((-1, 2))
+    # Segments incident to each node
+    ends = nodes.ravel()
+    order = np.argsort(ends, kind='mergesort')
+    starts = np.searchsorted(ends[order], np.arange(np.max(ends) + 2)).tolist()
+    incident = (order // 2).tolist()
+    nodes = nodes.tolist()
+    used = [node1 == node2 for node1, node2 in nodes]  # Degenerated
+
+    def follow(node):
+        # Walks along the unused segments, returning the points reached
+        path = []
+        while True:
+            for i in range(starts[node], starts[node + 1]):
+                k = incident[i]
+                if not used[k]:
+                    break
+            else:
+                return path, node
+            used[k] = True
+            end = 1 if nodes[k][0] == node else 0
+            node = nodes[k][end]
+            path.append(2 * k + end)
+
+    polygons, chains = [], []
+    for k in range(len(nodes)):
+        if not used[k]:
+            used[k] = True
+            forward, last = follow(nodes[k][1])
+            if forward and last == nodes[k][0]:
+                polygons.append(points[[2 * k, 2 * k + 1] + forward[:-1] +
+                                       [2 * k]])
             else:
-                a123 = calc.angle(point1, point2, point3)
-                if (a123 >= ang_min and a123 <= ang_max):
-                    continue
-            pnts.append(point2)
-        pnts.append(points[-1])
-        points = np.array(pnts)
-    return points
+                backward, first = follow(nodes[k][0])
+                chains.append(points[backward[::-1] + [2 * k, 2 * k + 1] +
+                                     forward])
+    return polygons, chains
+
+
+def get_edge_table(slice):
+    """Returns the (E, 2, 3) array of the edges of the slice polygons."""
+    return np.concatenate([np.stack((np.roll(polygon, 1, axis=0), polygon),
+                                    axis=1) for polygon in slice])
+
+
+def get_rotation2d(angle):
+    """Returns the 2D rotation matrix of the angle in radians."""
+    cos, sin = np.cos(angle), np.sin(angle)
+    return np.array([[cos, -sin], [sin, cos]])
+
+
+def get_scanline_crossings(edges, x_values):
+    """Calculates the crossings of the edges with the X scanlines.
+
+    Each edge crosses the scanlines in its half-open range [x_min, x_max),
+    so a vertex lying on a scanline is counted once when the polygon goes
+    through it and twice or never when it is a local extreme, keeping the
+    crossings of closed polygons even. Returns the scanline index and the
+    (C, 3) points of the crossings sorted by scanline and Y.
+    """
+    x1, x2 = edges[:, 0, 0], edges[:, 1, 0]
+    first = np.searchsorted(x_values, np.minimum(x1, x2), 'left')
+    counts = np.searchsorted(x_values, np.maximum(x1, x2), 'left') - first
+    indexes = np.repeat(np.arange(len(edges)), counts)
+    lines = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts -
+                                                  first, counts)
+    point1, point2 = edges[indexes, 0], edges[indexes, 1]
+    x_lines = x_values[lines]
+    t = (x_lines - point1[:, 0]) / (point2[:, 0] - point1[:, 0])
+    points = point1 + t.reshape((-1, 1)) * (point2 - point1)
+    points[:, 0] = x_lines
+    order = np.lexsort((points[:, 1], lines))
+    return lines[order], points[order]
+
+
+def get_inside_segments(points1, points2, edges, chunk_size=256):
+    """Checks which XY segments stay inside the polygons of the edges.
+
+    The segments can start and end on the edges, so they are inside when
+    their middle point is inside and they cross no edge between their end
+    points.
+    """
+    inside = np.zeros(len(points1), dtype=np.bool_)
+    edge1, edge2 = edges[:, 0, :2], edges[:, 1, :2]
+    vectors = edge2 - edge1
+    for k in range(0, len(points1), chunk_size):
+        point1 = points1[k:k + chunk_size, :2].reshape((-1, 1, 2))
+        point2 = points2[k:k + chunk_size, :2].reshape((-1, 1, 2))
+        # Even-odd rule of the middle points
+        middle = (point1 + point2) / 2
+        x, y = middle[:, :, 0], middle[:, :, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = (((edge1[:, 1] > y) != (edge2[:, 1] > y)) &
+                       (x < edge1[:, 0] + (y - edge1[:, 1]) * vectors[:, 0] /
+                        vectors[:, 1]))
+        in_middle = np.sum(crosses, axis=1) % 2 == 1
+        # Crossings of the segments with the edges, out of their end points
+        direction = point2 - point1
+        offsets = edge1 - point1
+        denominator = (direction[:, :, 0] * vectors[:, 1] -
+                       direction[:, :, 1] * vectors[:, 0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (offsets[:, :, 0] * vectors[:, 1] -
+                 offsets[:, :, 1] * vectors[:, 0]) / denominator
+            u = (offsets[:, :, 0] * direction[:, :, 1] -
+                 offsets[:, :, 1] * direction[:, :, 0]) / denominator
+            cuts = (t > 1e-6) & (t < 1 - 1e-6) & (u >= 0) & (u <= 1)
+        inside[k:k + chunk_size] = in_middle & np.logical_not(
+            np.any(cuts, axis=1))
+    return inside
 
 
 def get_range_values(v_min, v_max, v_dist):
@@ -33,8 +350,27 @@ def get_range_values(v_min, v_max, v_dist):
     return np.arange(i_min, i_max + v_dist, v_dist)
 
 
+# Mesh shared with the slicing worker processes
+_worker_mesh = None
+
+
+def _init_slices_worker(directory, dtype, tolerance):
+    global _worker_mesh
+    _worker_mesh = Mesh(None, dtype=dtype)
+    _worker_mesh.tolerance = tolerance
+    _worker_mesh.triangles = np.load(os.path.join(directory, 'triangles.npy'),
+                                     mmap_mode='r')
+    filename = os.path.join(directory, 'faces.npy')
+    if os.path.exists(filename):
+        _worker_mesh.faces = np.load(filename, mmap_mode='r')
+
+
+def _get_worker_slices(levels):
+    return _worker_mesh.get_slices(levels)
+
+
 class Mesh:
-    def __init__(self, filename):
+    def __init__(self, filename=None, dtype=np.float32, cache=None):
         # Bounding box
         self.origin = np.array([0.0, 0.0, 0.0])
         self.bpoint1 = np.array([0.0, 0.0, 0.0])
@@ -42,227 +378,412 @@ class Mesh:
         self.size = np.array([0.0, 0.0, 0.0])
         # Mesh loading routine
         self.valid = False
-        self.triangles = []
+        self.dtype = dtype
+        self.triangles = np.zeros((0, 3, 3), dtype=self.dtype)
+        # Indexed mesh
+        self.vertices = None
+        self.faces = None
+        self.edges = None
+        self.edge_faces = None
         self.sink = 0
-        if self.load_text_mesh(filename):
-            self.valid = True
-            self.bounding_box()
-        elif self.load_binary_mesh(filename):
+        # Chordal tolerance of the slice contours (mm)
+        self.tolerance = 0.01
+        # Preprocessed mesh cache
+        self.cache = cache
+        self.cache_key = None
+        # Slices cache in local coordinates (world = local * factor + offset)
+        self.slice_cache = None
+        self.mesh_key = None
+        self.offset = np.array([0.0, 0.0, 0.0])
+        self.factor = np.array([1.0, 1.0, 1.0])
+        if filename is None:
+            pass
+        elif self.load_cached_mesh(filename):
             self.valid = True
             self.bounding_box()
+        else:
+            if is_binary_stl(filename):
+                if self.load_binary_mesh(filename):
+                    self.valid = True
+                    self.bounding_box()
+            elif self.load_text_mesh(filename):
+                self.valid = True
+                self.bounding_box()
+            elif self.load_binary_mesh(filename):
+                self.valid = True
+                self.bounding_box()
+            if self.valid:
+                self.translate(np.float32([0, 0, 0]))  # translates the piece to the origin
+                self.resort_triangles()
+                self.save_cached_array('triangles', self.triangles)
         if self.valid:
-            self.translate(np.float32([0, 0, 0]))  # translates the piece to the origin
-            self.resort_triangles()
+            self.offset = np.array([0.0, 0.0, 0.0])
+            self.factor = np.array([1.0, 1.0, 1.0])
+            self.mesh_key = self.cache_key
+            if self.mesh_key is None:
+                self.mesh_key = hashlib.sha1(
+                    np.ascontiguousarray(self.triangles)).hexdigest()
+
+    def load_cached_array(self, name):
+        if self.cache_key is not None:
+            name = '%s-%s' % (name, np.dtype(self.dtype).name)
+            try:
+                return self.cache.load(self.cache_key, name)
+            except (IOError, OSError, ValueError) as error:
+                print "Unable to load cached mesh:", error
+        return None
+
+    def save_cached_array(self, name, array):
+        if self.cache_key is not None:
+            name = '%s-%s' % (name, np.dtype(self.dtype).name)
+            try:
+                self.cache.save(self.cache_key, name, array)
+            except (IOError, OSError) as error:
+                print "Unable to save cached mesh:", error
+
+    def load_cached_mesh(self, filename):
+        if self.cache is None:
+            return False
+        try:
+            self.cache_key = self.cache.get_key(filename)
+        except IOError as error:
+            print "Unable to hash mesh file:", error
+            return False
+        triangles = self.load_cached_array('triangles')
+        if triangles is None:
+            return False
+        self.triangles = triangles
+        print "Loaded cached STL:", filename
+        return True
 
     def load_binary_mesh(self, filename):
         try:
-            with open(filename, 'rb') as f:
-                data = f.read(84)  # skip header
-                while data != '':
-                    data = f.read(12)  # skip the normals entirely
-                    if data != '':
-                        tri = np.zeros((3, 3))
-                        for j in range(3):
-                            for i in range(3):
-                                data = f.read(4)
-                                tri[j, i] = struct.unpack('f', data)[0]
-                    else:
-                        break
-                    data = f.read(2)  # skip the attribute bytes
-                    self.triangles.append(tri)
+            triangles = read_binary_stl(filename)
+            self.triangles = np.ascontiguousarray(triangles, dtype=self.dtype)
             print "Loaded binary STL:", filename
-        except:
-            print "Unable to load binary STL"
+        except (IOError, OSError, ValueError) as error:
+            print "Unable to load binary STL:", error
             return False
         return True
 
     def load_text_mesh(self, filename):
-        template = " *facet normal +(?P<xn>.+) (?P<yn>.+) (?P<zn>.+)\n"
-        template += " *outer loop\n"
-        template += " *vertex +(?P<x1>.+) (?P<y1>.+) (?P<z1>.+)\n"
-        template += " *vertex +(?P<x2>.+) (?P<y2>.+) (?P<z2>.+)\n"
-        template += " *vertex +(?P<x3>.+) (?P<y3>.+) (?P<z3>.+)\n"
-        template += " *endloop\n"
-        template += " *endfacet\n"
         try:
-            f = open(filename)
-            lines = f.read()
-            f.close()
-            pattern = re.compile(template, re.MULTILINE)
-            results = pattern.findall(lines)
-            if results:
-                for xn, yn, zn, x1, y1, z1, x2, y2, z2, x3, y3, z3 in results:
-                    tri = np.array([[float(x1), float(y1), float(z1)],
-                                    [float(x2), float(y2), float(z2)],
-                                    [float(x3), float(y3), float(z3)]])
-                    self.triangles.append(tri)
-            else:
-                return False
-            print "Loaded binary STL:", filename
-        except:
-            print "Unable to load text STL"
+            triangles = read_text_stl(filename)
+            self.triangles = np.ascontiguousarray(triangles, dtype=self.dtype)
+            print "Loaded text STL:", filename
+        except (IOError, ValueError) as error:
+            print "Unable to load text STL:", error
             return False
         return True
 
+    def get_points(self):
+        """Returns the (3N, 3) view of the triangle vertices."""
+        return self.triangles.reshape((-1, 3))
+
     def bounding_box(self):
-        bx1, bx2 = 10000, -10000
-        by1, by2 = 10000, -10000
-        bz1, bz2 = 10000, -10000
-        for tri in self.triangles:
-            for k in range(3):
-                if tri[k, 0] < bx1:
-                    bx1 = tri[k, 0]
-                if tri[k, 0] > bx2:
-                    bx2 = tri[k, 0]
-                if tri[k, 1] < by1:
-                    by1 = tri[k, 1]
-                if tri[k, 1] > by2:
-                    by2 = tri[k, 1]
-                if tri[k, 2] < bz1:
-                    bz1 = tri[k, 2]
-                if tri[k, 2] > bz2:
-                    bz2 = tri[k, 2]
-        self.bpoint1 = np.array([bx1, by1, bz1])
-        self.bpoint2 = np.array([bx2, by2, bz2])
-        self.x_min, self.x_max = bx1, bx2
-        self.y_min, self.y_max = by1, by2
-        self.z_min, self.z_max = bz1, bz2
+        points = self.get_points()
+        self.bpoint1 = np.float64(np.min(points, axis=0))
+        self.bpoint2 = np.float64(np.max(points, axis=0))
+        self.x_min, self.y_min, self.z_min = self.bpoint1
+        self.x_max, self.y_max, self.z_max = self.bpoint2
         self.size = self.bpoint2 - self.bpoint1
 
     def translate(self, point):
-        trans = point - self.bpoint1
-        for k, tri in enumerate(self.triangles):
-            self.triangles[k] = tri + trans
+        trans = np.asarray(point - self.bpoint1, dtype=self.dtype)
+        self.triangles += trans
+        self.offset = self.offset + trans
+        if self.vertices is not None:
+            self.vertices += trans
         self.bounding_box()
 
     def scale(self, scale):
-        for k, tri in enumerate(self.triangles):
-            self.triangles[k] = tri * scale
+        scale = np.asarray(scale, dtype=self.dtype)
+        self.triangles *= scale
+        self.offset = self.offset * scale
+        self.factor = self.factor * scale
+        if self.vertices is not None:
+            self.vertices *= scale
         self.bounding_box()
 
     def resort_triangles(self):
         """Sorts vertices from smaller to greater Z."""
         # Sorting the triangle according to height makes slicing then easier
-        # point1, point2, point3 = resort(triangle)
-        for k, tri in enumerate(self.triangles):
-            self.triangles[k] = tri[tri[:, 2].argsort()]
+        indexes = np.argsort(self.triangles[:, :, 2], axis=1)
+        rows = np.arange(len(self.triangles)).reshape((-1, 1))
+        self.triangles = self.triangles[rows, indexes]
+        if self.faces is not None:
+            self.faces = self.faces[rows, indexes]
+
+    def index_mesh(self, tolerance=1e-4, adjacency=False):
+        """Builds the indexed mesh welding the coincident vertices."""
+        name = 'faces-%g' % tolerance
+        self.faces = self.load_cached_array(name)
+        if self.faces is None:
+            self.vertices, self.faces = weld_vertices(self.triangles,
+                                                      tolerance)
+            self.save_cached_array(name, self.faces)
+        else:
+            # Cached topology, vertices are taken from the current triangles
+            self.vertices = np.empty((np.max(self.faces) + 1, 3),
+                                     dtype=self.dtype)
+            self.vertices[self.faces.ravel()] = self.get_points()
+        if adjacency:
+            self.edges = self.load_cached_array('edges-%g' % tolerance)
+            self.edge_faces = self.load_cached_array('edge_faces-%g' %
+                                                     tolerance)
+            if self.edges is None or self.edge_faces is None:
+                self.edges, self.edge_faces = get_edge_faces(self.faces)
+                self.save_cached_array('edges-%g' % tolerance, self.edges)
+                self.save_cached_array('edge_faces-%g' % tolerance,
+                                       self.edge_faces)
+        return self.vertices, self.faces
 
     def get_z_intersect(self, triangle, z_level):
         """Gets the intersection line of the triangle with the plane in Z."""
         # Return the intersection of the tringle with the plane.
         # Returns None if the triangle does not intersect.
-        point1, point2, point3 = triangle
-        (x1, y1, z1), (x2, y2, z2), (x3, y3, z3) = point1, point2, point3
         intersect = None
-        if z1 < z_level:
-            dx21, dy21, dz21 = point2 - point1
-            dx31, dy31, dz31 = point3 - point1
-            dx32, dy32, dz32 = point3 - point2
-            if z2 > z_level:
-                xa = x1 + dx21 * (z_level - z1) / dz21
-                ya = y1 + dy21 * (z_level - z1) / dz21
-                if z3 > z_level:
-                    xb = x1 + dx31 * (z_level - z1) / dz31
-                    yb = y1 + dy31 * (z_level - z1) / dz31
-                else:
-                    xb = x2 + dx32 * (z_level - z2) / dz32
-                    yb = y2 + dy32 * (z_level - z2) / dz32
-                intersect = np.array([[xa, ya, z_level],
-                                      [xb, yb, z_level]])
-            elif z3 > z_level:
-                xa = x1 + dx31 * (z_level - z1) / dz31
-                ya = y1 + dy31 * (z_level - z1) / dz31
-                xb = x2 + dx32 * (z_level - z2) / dz32
-                yb = y2 + dy32 * (z_level - z2) / dz32
-                intersect = np.array([[xa, ya, z_level],
-                                      [xb, yb, z_level]])
+        if triangle[0, 2] <= z_level < triangle[2, 2]:
+            segments = get_z_intersects(triangle.reshape((1, 3, 3)), z_level)
+            if len(segments):
+                intersect = segments[0]
         return intersect
 
     def get_slice(self, z_level):
         """Calculates the polygons in the slice for a plane."""
-        unsorted_lines = []
-        for triangle in self.triangles:
-            if (triangle[0, 2] < z_level) and (triangle[2, 2] > z_level):
-                intersection = self.get_z_intersect(triangle, z_level)
-                unsorted_lines.append(intersection)
-            elif (triangle[0, 2] == z_level) and (triangle[2, 2] == z_level):
-                print "WARNING: Triangle in z_level!"
-        if not unsorted_lines == []:
-            # Arrange the line segments so that each segment leads to the
-            # nearest available segment. This is accomplished by using two
-            # list of lines, and at each step moving the nearest available
-            # line segment from the unsorted pile to the next slot in the
-            # sorted pile.
-            epsilon = 1e-9
-            polygons = []
-            point1, point2 = unsorted_lines[0]
-            polygon = [point1, point2]
-            unsorted_lines.pop(0)
-            while unsorted_lines:
-                last_point = polygon[-1]
-                do_flip, new_line = False, True
-                for i, (point1, point2) in enumerate(unsorted_lines):
-                    if calc.distance2(last_point, point1) < epsilon:
-                        do_flip, new_line = False, False
-                        break
-                    if calc.distance2(last_point, point2) < epsilon:
-                        do_flip, new_line = True, False
-                        break
-                    new_line = True
-                point1, point2 = unsorted_lines[i]
-                unsorted_lines.pop(i)
-                if new_line:
-                    polygons.append(np.array(polygon))
-                    polygon = [point1, point2]
+        z_min = np.float64(self.triangles[:, 0, 2])  # Same precision as the
+        z_max = np.float64(self.triangles[:, 2, 2])  # intersection kernel
+        spanning = (z_min <= z_level) & (z_max > z_level)
+        flat = (z_min == z_level) & (z_max == z_level)
+        return self.get_slice_polygons(np.flatnonzero(spanning), z_level,
+                                       np.count_nonzero(flat))
+
+    def iter_slices(self, levels):
+        """Yields the slice of each level sweeping the plane upwards.
+
+        Triangles are sorted once by their lower Z, so each level only
+        checks the active triangles spanning the previous level and the
+        ones entering the plane since then.
+        """
+        if np.any(np.diff(levels) < 0):
+            raise ValueError('Slice levels must be in ascending order')
+        z_min = np.float64(self.triangles[:, 0, 2])  # Same precision as the
+        z_max = np.float64(self.triangles[:, 2, 2])  # intersection kernel
+        order = np.argsort(z_min, kind='mergesort')
+        z_starts = z_min[order]
+        active = np.zeros(0, dtype=order.dtype)
+        start = 0
+        for z_level in levels:
+            end = np.searchsorted(z_starts, z_level, side='right')
+            active = np.concatenate((active, order[start:end]))
+            active = active[z_max[active] > z_level]
+            start = end
+            # Triangles lying on the plane are not included in the set
+            on_plane = order[np.searchsorted(z_starts, z_level, 'left'):end]
+            flat = np.count_nonzero(z_max[on_plane] == z_level)
+            yield self.get_slice_polygons(np.sort(active), z_level, flat)
+
+    def get_slices(self, levels, processes=1):
+        """Calculates the slices for all the levels."""
+        return [slice for slice in self.iter_cached_slices(levels,
+                                                           processes)]
+
+    def iter_cached_slices(self, levels, processes=1):
+        """Yields the slices of the levels reusing the cached ones.
+
+        Slices are cached in the mesh local coordinates, keyed by the local
+        level and layer height, so translating or resizing the mesh in XY
+        only transforms the cached contours instead of slicing it again.
+        """
+        if self.slice_cache is None:
+            for slice in self.iter_parallel_slices(levels, processes):
+                yield slice
+            return
+        levels = np.asarray(levels, dtype=np.float64)
+        offset, factor = self.offset, self.factor
+        local_levels = (levels - offset[2]) / factor[2]
+        layer_height = 0.0
+        if len(levels) > 1:
+            layer_height = (local_levels[1] - local_levels[0])
+        keys = [(self.mesh_key, int(round(1e6 * z)),
+                 int(round(1e6 * layer_height)),
+                 int(round(1e6 * self.tolerance))) for z in local_levels]
+        cached = dict([(k, self.slice_cache[key]) for k, key in enumerate(keys)
+                       if key in self.slice_cache])
+        missing = [k for k in range(len(keys)) if k not in cached]
+        slicer = self.iter_parallel_slices(levels[missing], processes)
+        for k, (key, z_level) in enumerate(zip(keys, levels)):
+            if k in cached:
+                slice = cached[k]
+                if slice is not None:
+                    slice = [polygon * factor + offset for polygon in slice]
+                    for polygon in slice:
+                        polygon[:, 2] = z_level
+            else:
+                slice = next(slicer)
+                if slice is None:
+                    self.slice_cache[key] = None
                 else:
-                    if do_flip:
-                        if not (calc.distance2(polygon[-1], point1) < epsilon):
-                            polygon.append(point1)
-                    else:
-                        if not (calc.distance2(polygon[-1], point2) < epsilon):
-                            polygon.append(point2)
-            polygons.append(np.array(polygon))
-            return [filter_polyline(polygon, dist=0,
-                                    angl=0) for polygon in polygons]  # Polygons filter
+                    self.slice_cache[key] = [(polygon - offset) / factor
+                                             for polygon in slice]
+            yield slice
+
+    def iter_parallel_slices(self, levels, processes=None, chunks=4):
+        """Yields the slices of the levels calculated in a process pool.
+
+        Ranges of consecutive levels are swept by the worker processes,
+        which read the mesh from a memory mapped file, and the slices are
+        yielded in order. Slices are calculated by iter_slices in this
+        process for a single process or when the pool cannot be started.
+        """
+        if np.any(np.diff(levels) < 0):
+            raise ValueError('Slice levels must be in ascending order')
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        n_ranges = min(len(levels), processes * chunks)
+        if processes < 2 or n_ranges < 2:
+            for slice in self.iter_slices(levels):
+                yield slice
+            return
+        directory = tempfile.mkdtemp(prefix='robpath-')
+        pool = None
+        try:
+            np.save(os.path.join(directory, 'triangles.npy'), self.triangles)
+            if self.faces is not None:
+                np.save(os.path.join(directory, 'faces.npy'), self.faces)
+            try:
+                pool = multiprocessing.Pool(processes, _init_slices_worker,
+                                            (directory, self.dtype,
+                                             self.tolerance))
+            except (OSError, ImportError) as error:
+                print "Unable to start the slicing processes:", error
+            if pool is None:
+                for slice in self.iter_slices(levels):
+                    yield slice
+            else:
+                ranges = np.array_split(levels, n_ranges)
+                for slices in pool.imap(_get_worker_slices, ranges):
+                    for slice in slices:
+                        yield slice
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def get_slice_polygons(self, indexes, z_level, n_flat=0):
+        """Calculates the polygons of the triangles spanning the plane."""
+        if n_flat:
+            print "WARNING: %i triangles in z_level!" % n_flat
+        keys = None
+        if self.faces is not None:
+            segments, keys = get_z_intersects(self.triangles[indexes],
+                                              z_level, self.faces[indexes])
         else:
-            return None
-
-    def get_grated(self, slice, dist):
-        fill_lines = []
-        x_min = np.min([np.min(poly[:, 0]) for poly in slice])
-        x_max = np.max([np.max(poly[:, 0]) for poly in slice])
-        for x in get_range_values(x_min, x_max, dist):
-            points = []
-            for poly in slice:
-                for k in range(len(poly)):
-                    point = None
-                    point1, point2 = poly[k-1], poly[k]
-                    if point2[0] == x:
-                        point = point2
-                    else:
-                        if (point1[0] < x and point2[0] > x) or (point1[0] > x and point2[0] < x):
-                            m, b = calc.line2d(point1[:2], point2[:2])
-                            point = np.array([x, m * x + b, point1[2]])
-                    if point is not None:
-                        points.append(point)
-            if not points == []:
-                points = np.array(points)
-                indexes = np.argsort(points[:, 1])
-                # ERROR!!!
-                if len(indexes) % 2:
-                    print 'ERROR IMPAR!', len(indexes)  #tangent element finded
-                    indexes = indexes[:len(indexes)-1]
-                #for k in range(0, len(indexes), 2):
-                #    i1, i2 = indexes[k], indexes[k+1]
-                #    fill_lines.append(np.array((points[i1,:], points[i2,:])))
-                #TODO: Group lines (pnt1, pnt2) with the same x value, in the same group of points.
-                fill_lines.append(points[indexes])
+            segments = get_z_intersects(self.triangles[indexes], z_level)
+        if len(segments):
+            polygons, chains = chain_segments(segments, keys)
+            if chains:
+                print "WARNING: %i open contours in z_level!" % len(chains)
+            if polygons or chains:
+                return [simplify_polyline(polygon, self.tolerance)
+                        for polygon in polygons + chains]
+        return None
+
+    def get_grated(self, slice, dist, angle=0.0):
+        """Calculates the fill lines of the slice with scanlines.
+
+        Scanlines are parallel to the X axis rotated by the hatch angle (in
+        radians). Returns the crossing points of each scanline sorted along
+        it, where each consecutive pair of points is a segment inside the
+        slice.
+        """
+        edges = get_edge_table(slice)
+        if angle:
+            edges[:, :, :2] = np.dot(edges[:, :, :2],
+                                     get_rotation2d(-angle).T)
+        x_values = get_range_values(np.min(edges[:, :, 0]),
+                                    np.max(edges[:, :, 0]), dist)
+        lines, points = get_scanline_crossings(edges, x_values)
+        # Crossings pair up in each scanline, tangent pairs are removed
+        pairs = points.reshape((-1, 2, 3))
+        valid = pairs[:, 1, 1] > pairs[:, 0, 1]
+        lines, pairs = lines[::2][valid], pairs[valid]
+        if angle:
+            pairs[:, :, :2] = np.dot(pairs[:, :, :2], get_rotation2d(angle).T)
+        splits = np.flatnonzero(np.diff(lines)) + 1
+        fill_lines = [pnts.reshape((-1, 3)) for pnts in np.split(pairs, splits)
+                      if len(pnts)]
         return fill_lines
 
-    def get_path_from_fill_lines(self, fill_lines):
+    def get_fill_regions(self, fill_lines, dist, angle=0.0):
+        """Groups the fill segments in regions to be filled continuously.
+
+        Segments of consecutive scanlines stay in the same region while
+        they overlap one to one, like in a boustrophedon decomposition, so
+        islands, splits and merges of the slice start new regions. Returns
+        the list of regions with their (2, 3) segments by scanline.
+        """
+        rotation = get_rotation2d(-angle)
+        regions = []
+        last_u, last_ranges, last_regions = None, None, []
+        for line in fill_lines:
+            segments = line.reshape((-1, 2, 3))
+            uv = np.dot(segments[:, :, :2], rotation.T)  # Scanline coordinates
+            u = uv[0, 0, 0]
+            ranges = np.sort(uv[:, :, 1], axis=1)
+            indexes = [None] * len(segments)
+            if last_u is not None and abs(u - last_u) < 1.5 * dist:
+                overlap = ((last_ranges[:, 0].reshape((-1, 1)) < ranges[:, 1]) &
+                           (ranges[:, 0] < last_ranges[:, 1].reshape((-1, 1))))
+                for k in range(len(segments)):
+                    previous = np.flatnonzero(overlap[:, k])
+                    if len(previous) == 1 and np.sum(overlap[previous[0]]) == 1:
+                        indexes[k] = last_regions[previous[0]]
+            for k, segment in enumerate(segments):
+                if indexes[k] is None:
+                    indexes[k] = len(regions)
+                    regions.append([])
+                regions[indexes[k]].append(segment)
+            last_u, last_ranges, last_regions = u, ranges, indexes
+        return regions
+
+    def get_path_from_fill_regions(self, regions, layer=0, slice=None,
+                                   max_length=0.0):
+        """Calculates the zigzag path filling each region.
+
+        The laser stays on along the connector to the next segment of the
+        region when it is not longer than max_length and stays inside the
+        slice, when given. Other connectors are travel moves.
+        """
+        orientation = np.array((0.0, 0.0, 0.0, 1.0))
+        tool_path = ToolPath()
+        if not regions:
+            return tool_path
+        segments = [np.array(region, dtype=np.float64) for region in regions]
+        for region in segments:
+            region[1::2] = region[1::2, ::-1]
+        # Connectors from the end of each segment to the start of the next
+        ends = np.concatenate([region[:-1, 1] for region in segments])
+        starts = np.concatenate([region[1:, 0] for region in segments])
+        vectors = starts - ends
+        joined = np.sqrt(np.sum(vectors * vectors, axis=1)) <= max_length
+        if slice is not None and np.any(joined):
+            joined[joined] = get_inside_segments(ends[joined], starts[joined],
+                                                 get_edge_table(slice))
+        n_joined = 0
+        for region in segments:
+            processes = np.ones((len(region), 2), dtype=np.bool_)
+            processes[0, 0] = False
+            processes[1:, 0] = joined[n_joined:n_joined + len(region) - 1]
+            n_joined += len(region) - 1
+            tool_path.append_arrays(region.reshape((-1, 3)), orientation,
+                                    processes.ravel(), layer)
+        return tool_path
+
+    def get_path_from_fill_lines(self, fill_lines, layer=0):
         orientation = np.array((0.0, 0.0, 0.0, 1.0))
-        pnt1, pnt2 = fill_lines[0][0], fill_lines[0][1]
-        tool_path = []
+        positions, processes = [], []
         pair = False
         #offset = 10 # Adds an offset on the end of the track
         for line in fill_lines:
@@ -272,56 +793,67 @@ class Mesh:
             pair = not pair
             for k in range(0, len(line), 2):
                 pnt1, pnt2 = line[k], line[k+1]
-                if len(tool_path):
-                    last_point = tool_path[-1][0]
-                    if np.all(last_point == pnt1):
-                        tool_path[-1] = [pnt2, orientation, True]
-                    else:
-                        tool_path.append([pnt1, orientation, False])
-                        tool_path.append([pnt2, orientation, True])
+                if len(positions) and np.all(positions[-1] == pnt1):
+                    positions[-1] = pnt2
                 else:
-                    tool_path.append([pnt1, orientation, False])
-                    tool_path.append([pnt2, orientation, True])
+                    positions.extend([pnt1, pnt2])
+                    processes.extend([False, True])
             # Adds the offset path
-            #last_point = tool_path[-1][0]
-            #tool_path.append([last_point + np.float32([0, offset, 0]), orientation, False])
+            #positions.append(positions[-1] + np.float32([0, offset, 0]))
+            #processes.append(False)
+        tool_path = ToolPath()
+        if positions:
+            tool_path.append_arrays(np.array(positions), orientation,
+                                    processes, layer)
         return tool_path
 
-    def get_path_from_slices(self, slices):
+    def get_path_from_slices(self, slices, layer=0):
         orientation = np.array((0.0, 0.0, 0.0, 1.0))
-        tool_path = []
+        tool_path = ToolPath()
         for slice in slices:
             if slice is not None:
                 for contour in slice:
-                    tool_path.append([contour[0], orientation, False])
-                    for point in contour[1:]:
-                        tool_path.append([point, orientation, True])
+                    processes = np.ones(len(contour), dtype=np.bool_)
+                    processes[0] = False
+                    tool_path.append_arrays(contour, orientation, processes,
+                                            layer)
         return tool_path
 
-    def get_mesh_slices_path(self, layer_height, track_distance):
-        slices = []
-        path = []
+    def iter_mesh_slices_path(self, layer_height, track_distance,
+                              processes=1):
+        """Yields the (slice, tool path) of each layer as it is sliced.
+
+        Each slice is grated once, reusing the cached slices when the mesh
+        has a slice cache.
+        """
         t0 = time.time()
-        levels = get_range_values(mesh.z_min, mesh.z_max, layer_height)
+        levels = get_range_values(self.z_min, self.z_max, layer_height)
         pair = False
-        for k, z_level in enumerate(levels):
-            slice = mesh.get_slice(z_level)
-            slices.append(slice)
+        for k, slice in enumerate(self.iter_cached_slices(levels,
+                                                          processes)):
             t1 = time.time()
             print '[%.2f%%] Time to slices %.3f s.' % ((100.0 * (k + 1)) / len(levels), t1 - t0)
+            path = ToolPath()
             if slice is not None:
-                for contour in slice:
-                    fill_lines = self.get_grated(slice, track_distance)
-                    # Reverse the order of the slicer fill lines
-                    if pair:
-                        fill_lines.reverse()
-                    pair = not pair
-                    tool_path = self.get_path_from_fill_lines(fill_lines)
-                    path.extend(tool_path)
+                fill_lines = self.get_grated(slice, track_distance)
+                # Reverse the order of the slicer fill lines
+                if pair:
+                    fill_lines.reverse()
+                pair = not pair
+                path = self.get_path_from_fill_lines(fill_lines, k)
                 t2 = time.time()
-                print '[%.2f%%] Time to path %.3f s.' % ((100.0 * (k + 1)) / len(slices), t2 - t1)
-        return slices, path
+                print '[%.2f%%] Time to path %.3f s.' % ((100.0 * (k + 1)) / len(levels), t2 - t1)
+            yield slice, path
 
+    def get_mesh_slices_path(self, layer_height, track_distance, processes=1):
+        slices = []
+        path = ToolPath()
+        for slice, tool_path in self.iter_mesh_slices_path(layer_height,
+                                                           track_distance,
+                                                           processes):
+            slices.append(slice)
+            path.extend(tool_path)
+        return slices, path
 
 if __name__ == '__main__':
     import sys
@@ -353,7 +885,7 @@ if __name__ == '__main__':
     path = mesh.get_path_from_fill_lines(lines)
     t1 = time.time()
     print 'Time for path:', t1 - t0
-    print 'Path:', path
+    print 'Path:', path.array
 
     mplot3d = MPlot3D()
     mplot3d.draw_path(path)
@@ -5,6 +5,7 @@ import numpy as np
 from mayavi import mlab
 
 import calculate as calc
+from toolpath import as_toolpath
 
 BLACK = (0, 0, 0)
 WHITE = (1, 1, 1)
@@ -157,13 +158,9 @@ class MPlot3D():
         self.draw_tools(points, frames)
 
     def _get_triangular_mesh(self, mesh):
-        x, y, z = [], [], []
-        for tri in mesh.triangles:
-            for pnt in tri:
-                x.append(pnt[0])
-                y.append(pnt[1])
-                z.append(pnt[2])
-        triangles = [(i, i+1, i+2) for i in range(0, len(x), 3)]
+        points = mesh.get_points()
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        triangles = np.arange(len(points)).reshape((-1, 3))
         return x, y, z, triangles
 
     def draw_mesh(self, mesh, color=WHITE, opacity=0.7):
@@ -178,13 +175,10 @@ class MPlot3D():
         #mlab.axes()
 
     def draw_path(self, path):
-        points, vectors, processes = [], [], []
-        for k in range(1, len(path)):
-            points.append(path[k][0])
-            vectors.append(path[k-1][0] - path[k][0])
-            processes.append(path[k][2])
-        points, vectors = np.array(points), np.array(vectors)
-        processes = np.array(processes)
+        path = as_toolpath(path)
+        points = path.positions[1:]
+        vectors = path.positions[:-1] - points
+        processes = path.processes[1:]
         pnts, vctrs = points[processes], vectors[processes]
         mlab.quiver3d(pnts[:, 0], pnts[:, 1], pnts[:, 2],
                       vctrs[:, 0], vctrs[:, 1], vctrs[:, 2],
@@ -0,0 +1,313 @@
+import hashlib
+import numpy as np
+
+
+def get_signed_area(polygon):
+    """Calculates the signed area of the polygon, positive when CCW."""
+    x, y = polygon[:, 0], polygon[:, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+
+def get_containment(points, polygon):
+    """Tests which points are inside the polygon (even-odd rule)."""
+    x, y = points[:, 0].reshape((-1, 1)), points[:, 1].reshape((-1, 1))
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (x2 - x1) * (y - y1) / (y2 - y1)
+        crosses = ((y1 > y) != (y2 > y)) & (x < x_cross)
+    return np.sum(crosses, axis=1) % 2 == 1
+
+
+def orient_polygons(polygons):
+    """Orients the polygons to keep the material on the left side.
+
+    Outer contours are turned counterclockwise and holes, nested an odd
+    number of times, clockwise.
+    """
+    points = np.array([polygon[0] for polygon in polygons])
+    depth = np.zeros(len(polygons), dtype=np.int32)
+    for k, polygon in enumerate(polygons):
+        inside = get_containment(points, polygon)
+        inside[k] = False
+        depth += inside
+    oriented = []
+    for polygon, level in zip(polygons, depth):
+        if (get_signed_area(polygon) > 0) != (level % 2 == 0):
+            polygon = polygon[::-1]
+        oriented.append(polygon)
+    return oriented
+
+
+def get_raw_offset(polygon, distance, join='round', miter_limit=2.0,
+                   arc_tolerance=0.01):
+    """Calculates the untrimmed offset of the polygon to its left side.
+
+    Edges are moved along their normals, keeping their full length, and
+    joined on convex corners by the chord between them, which crosses
+    the trimmed part. Reflex corners, which open a gap between the offset
+    edges, are joined with arcs (round join) or the crossing of the edges
+    (miter join), cut by a chord over the miter limit. Returns the (M, 2)
+    closed loop of points, not repeating the first one, and the corner of
+    the join chord starting on each point (NaN on the edges), or None
+    for degenerated polygons.
+    """
+    points = polygon[:, :2]
+    for k in range(2):
+        # Removes repeated points first, and collinear points later
+        vectors = np.roll(points, -1, axis=0) - points
+        lengths = np.sqrt(np.sum(vectors ** 2, axis=1))
+        points, vectors, lengths = (points[lengths > 1e-9],
+                                    vectors[lengths > 1e-9],
+                                    lengths[lengths > 1e-9])
+        if len(points) < 3:
+            return None, None
+        tangents = vectors / lengths.reshape((-1, 1))
+        normals = np.column_stack((-tangents[:, 1], tangents[:, 0]))
+        normals_in = np.roll(normals, 1, axis=0)  # Previous edge normal
+        dot = np.sum(normals_in * normals, axis=1)
+        cross = (normals_in[:, 0] * normals[:, 1] -
+                 normals_in[:, 1] * normals[:, 0])
+        sweep = np.arctan2(cross, dot)  # Positive on convex corners
+        if k == 0:
+            points = points[np.abs(sweep) > 1e-12]
+    if join == 'round':
+        step = 2 * np.arccos(np.clip(1 - arc_tolerance / distance, -1, 1))
+        n_steps = np.ceil(np.abs(sweep) / max(step, 1e-3)).astype(np.int64)
+        n_steps = np.where(sweep < 0, np.maximum(n_steps, 1), 1)
+        miter = np.zeros(len(points), dtype=np.bool_)
+    else:
+        n_steps = np.ones(len(points), dtype=np.int64)
+        miter = (sweep < 0) & ((1 + dot) * miter_limit ** 2 >= 2)
+    counts = np.where(miter, 1, n_steps + 1)
+    indexes = np.repeat(np.arange(len(points)), counts)
+    steps = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    angles = (np.arctan2(normals_in[:, 1], normals_in[:, 0])[indexes] +
+              sweep[indexes] * steps / np.maximum(counts - 1, 1)[indexes])
+    offset = points[indexes] + distance * np.column_stack((np.cos(angles),
+                                                           np.sin(angles)))
+    mitered = miter[indexes]
+    bisectors = ((normals_in + normals) /
+                 np.maximum(1 + dot, 1e-12).reshape((-1, 1)))
+    offset[mitered] = (points + distance * bisectors)[indexes[mitered]]
+    # Corners of the reflex join chords, closer to them than the distance
+    chords = ((steps < counts[indexes] - 1) & ~mitered &
+              (sweep[indexes] < 0))
+    centers = np.where(chords.reshape((-1, 1)), points[indexes], np.nan)
+    return offset, centers
+
+
+def get_distances(points, segments, size=2097152):
+    """Calculates the distances from the points to the nearest segment."""
+    origins = segments[:, 0]
+    vectors = segments[:, 1] - segments[:, 0]
+    lengths2 = np.maximum(np.sum(vectors ** 2, axis=1), 1e-18)
+    distances = np.empty(len(points))
+    block = max(1, size // max(1, len(segments)))
+    for k in range(0, len(points), block):
+        diffs = points[k:k + block].reshape((-1, 1, 2)) - origins
+        t = np.clip(np.sum(diffs * vectors, axis=2) / lengths2, 0, 1)
+        diffs -= t.reshape(t.shape + (1,)) * vectors
+        distances[k:k + block] = np.sqrt(np.min(np.sum(diffs ** 2, axis=2),
+                                                axis=1))
+    return distances
+
+
+def get_intersections(segments, neighbours, margin=0.0, size=2097152):
+    """Calculates the crossings between the (S, 2, 2) segments.
+
+    Neighbour segments, given by the index of the next segment in each
+    loop, are not tested. Segments are extended the margin distance, to
+    catch the crossings on their ends. Returns the pairs of crossing
+    segments, their parameters along both segments and the crossing points.
+    """
+    origins = segments[:, 0]
+    vectors = segments[:, 1] - segments[:, 0]
+    margins = margin / np.maximum(np.sqrt(np.sum(vectors ** 2, axis=1)),
+                                  1e-12)
+    lower = np.minimum(segments[:, 0], segments[:, 1]) - margin
+    upper = np.maximum(segments[:, 0], segments[:, 1]) + margin
+    pairs, params = [], []
+    block = max(1, size // max(1, len(segments)))
+    for start in range(0, len(segments), block):
+        rows = np.arange(start, min(start + block, len(segments)))
+        overlap = (np.all(lower[rows].reshape((-1, 1, 2)) <= upper, axis=2) &
+                   np.all(lower <= upper[rows].reshape((-1, 1, 2)), axis=2))
+        overlap &= np.arange(len(segments)) > rows.reshape((-1, 1))
+        rows, columns = np.nonzero(overlap)
+        rows += start
+        valid = (neighbours[rows] != columns) & (neighbours[columns] != rows)
+        rows, columns = rows[valid], columns[valid]
+        vector1, vector2 = vectors[rows], vectors[columns]
+        diffs = origins[columns] - origins[rows]
+        denom = vector1[:, 0] * vector2[:, 1] - vector1[:, 1] * vector2[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (diffs[:, 0] * vector2[:, 1] -
+                 diffs[:, 1] * vector2[:, 0]) / denom
+            u = (diffs[:, 0] * vector1[:, 1] -
+                 diffs[:, 1] * vector1[:, 0]) / denom
+            crossing = ((t > -margins[rows]) & (t < 1 + margins[rows]) &
+                        (u > -margins[columns]) & (u < 1 + margins[columns]))
+        pairs.append(np.column_stack((rows, columns))[crossing])
+        params.append(np.clip(np.column_stack((t, u))[crossing], 0, 1))
+    pairs, params = np.vstack(pairs), np.vstack(params)
+    points = origins[pairs[:, 0]] + params[:, :1] * vectors[pairs[:, 0]]
+    return pairs, params, points
+
+
+def trim_offset(loops, centers, contours, distance, snap=0.01,
+                tolerance=1e-6):
+    """Trims the raw offset loops of the contours to the valid polygons.
+
+    Loops are split at their self-intersections, and the pieces closer
+    to the contours than the offset distance are removed, measuring the
+    pieces of the join chords on their arcs. The remaining pieces are
+    walked again, in the loop direction, in closed polygons, snapping the
+    gaps between their ends under the snap distance.
+    """
+    segments = np.vstack([np.stack((loop, np.roll(loop, -1, axis=0)),
+                                   axis=1) for loop in loops])
+    sizes = np.array([len(loop) for loop in loops])
+    starts = np.cumsum(sizes) - sizes
+    neighbours = np.arange(len(segments)) + 1
+    neighbours[starts + sizes - 1] = starts
+    pairs, params, points = get_intersections(segments, neighbours, tolerance)
+    # Splits the segments at the crossings, sharing the crossing nodes
+    n_segments, n_crossings = len(segments), len(pairs)
+    crossings = np.arange(n_crossings) + n_segments
+    indexes = np.concatenate((np.arange(n_segments), np.arange(n_segments),
+                              pairs[:, 0], pairs[:, 1]))
+    ts = np.concatenate((np.zeros(n_segments), np.ones(n_segments),
+                         params[:, 0], params[:, 1]))
+    nodes = np.concatenate((np.arange(n_segments), neighbours,
+                            crossings, crossings))
+    pnts = np.vstack((segments[:, 0], segments[:, 1], points, points))
+    order = np.lexsort((ts, indexes))
+    indexes, nodes, pnts = indexes[order], nodes[order], pnts[order]
+    same = indexes[1:] == indexes[:-1]
+    edges = np.column_stack((nodes[:-1][same], nodes[1:][same]))
+    pieces = np.stack((pnts[:-1][same], pnts[1:][same]), axis=1)
+    centers = np.concatenate(centers)[indexes[:-1][same]]
+    # Removes the pieces too close to the contours
+    contour_segments = np.vstack([np.stack((contour[:-1, :2],
+                                            contour[1:, :2]), axis=1)
+                                  for contour in contours])
+    middles = np.mean(pieces, axis=1)
+    arcs = np.isfinite(centers[:, 0])
+    radii = middles[arcs] - centers[arcs]
+    radii /= np.maximum(np.sqrt(np.sum(radii ** 2, axis=1)),
+                        1e-12).reshape((-1, 1))
+    middles[arcs] = centers[arcs] + distance * radii
+    valid = get_distances(middles, contour_segments) >= distance - tolerance
+    edges, pieces = edges[valid].tolist(), pieces[valid]
+    outgoing = {}
+    for k, (node1, node2) in enumerate(edges):
+        outgoing.setdefault(node1, []).append(k)
+    z_level = contours[0][0, 2]
+    polygons = []
+    used = np.zeros(len(edges), dtype=np.bool_)
+    for k in range(len(edges)):
+        if used[k]:
+            continue
+        used[k] = True
+        path, node = [k], edges[k][1]
+        while node != edges[k][0]:
+            ks = [i for i in outgoing.get(node, []) if not used[i]]
+            if not ks:
+                # Crossings of almost parallel segments do not match exactly
+                end = pieces[path[-1], 1]
+                if np.sum((end - pieces[k, 0]) ** 2) <= snap ** 2:
+                    break
+                gaps = np.sum((pieces[:, 0] - end) ** 2, axis=1)
+                gaps[used] = np.inf
+                ks = [np.argmin(gaps)]
+                if gaps[ks[0]] > snap ** 2:
+                    path = []
+                    break
+            used[ks[0]] = True
+            path.append(ks[0])
+            node = edges[ks[0]][1]
+        if len(path) > 2:
+            polygon = np.vstack((pieces[path, 0], pieces[path[:1], 0]))
+            if abs(get_signed_area(polygon)) > snap ** 2:
+                polygons.append(np.column_stack(
+                    (polygon, np.ones(len(polygon)) * z_level)))
+    return polygons
+
+
+def offset_polygons(polygons, distance, join='round', miter_limit=2.0,
+                    arc_tolerance=0.01):
+    """Calculates the polygons offset inwards the given distance."""
+    contours = [polygon if np.array_equal(polygon[0], polygon[-1]) else
+                np.vstack((polygon, polygon[:1]))
+                for polygon in orient_polygons(polygons)]
+    loops, centers = [], []
+    for contour in contours:
+        loop, center = get_raw_offset(contour, distance, join, miter_limit,
+                                      arc_tolerance)
+        if loop is not None:
+            loops.append(loop)
+            centers.append(center)
+    if not loops:
+        return []
+    return trim_offset(loops, centers, contours, distance,
+                       max(arc_tolerance, 0.1 * distance))
+
+
+def get_offsets(slice, distance, n_offsets, join='round', miter_limit=2.0,
+                arc_tolerance=0.01, cache=None):
+    """Calculates the contour parallel offsets of the slice.
+
+    Returns the list of offset slices, spaced the given distance inwards,
+    until the number of offsets or the slice is filled. Offsets are stored
+    in the cache, when given, by the hash of the slice contours.
+    """
+    if not slice:
+        return []
+    key = None
+    if cache is not None:
+        sha1 = hashlib.sha1()
+        for polygon in slice:
+            sha1.update(np.ascontiguousarray(polygon))
+        key = (sha1.hexdigest(), distance, n_offsets, join, miter_limit,
+               arc_tolerance)
+        if key in cache:
+            return cache[key]
+    offsets = []
+    for k in range(1, n_offsets + 1):
+        polygons = offset_polygons(slice, k * distance, join, miter_limit,
+                                   arc_tolerance)
+        if not polygons:
+            break
+        offsets.append(polygons)
+    if key is not None:
+        cache[key] = offsets
+    return offsets
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from mesh import Mesh, get_range_values
+    from mlabplot import MPlot3D
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/flange.stl'
+
+    mesh = Mesh(filename)
+    levels = get_range_values(mesh.z_min, mesh.z_max, 1.0)
+    slice = mesh.get_slice(levels[len(levels) / 2])
+
+    t0 = time.time()
+    offsets = get_offsets(slice, 1.5, 10)
+    t1 = time.time()
+    print 'Time for offsets:', t1 - t0
+
+    mplot3d = MPlot3D()
+    mplot3d.draw_slice(slice)
+    for polygons in offsets:
+        mplot3d.draw_slice(polygons)
+    mplot3d.show()
@@ -0,0 +1,218 @@
+import time
+import numpy as np
+
+from toolpath import concatenate, get_view
+
+
+def get_distances(points1, points2):
+    """Returns the distances between the points, zero for the NaN points."""
+    vectors = points2 - points1
+    # fmax returns the other value, zero, for the NaN distances
+    return np.fmax(np.sqrt(np.sum(vectors * vectors, axis=-1)), 0)
+
+
+def get_travel_distance(path, origin=None):
+    """Calculates the length of the travel moves of the tool path."""
+    positions = path.positions
+    if len(positions) == 0:
+        return 0.0
+    travel = np.sum(get_distances(positions[:-1], positions[1:])[
+        np.logical_not(path.processes[1:])])
+    if origin is not None:
+        travel += get_distances(np.asarray(origin), positions[0])
+    return float(travel)
+
+
+def get_runs(path):
+    """Returns the (start, end) of the runs starting with a travel move."""
+    starts = np.flatnonzero(np.logical_not(path.processes))
+    if len(starts) == 0 or starts[0] != 0:
+        starts = np.append(0, starts)
+    ends = np.append(starts[1:], len(path))
+    return np.vstack((starts, ends)).T
+
+
+def get_nearest_order(entries, exits, origin=None):
+    """Calculates the nearest neighbour order of the runs.
+
+    Each run can be entered by any end, and it is reversed when entered by
+    its exit. Returns the order and the reversed flags of the runs.
+    """
+    n_runs = len(entries)
+    points = np.vstack((entries, exits))
+    visited = np.zeros(n_runs, dtype=np.bool_)
+    order = np.zeros(n_runs, dtype=np.int32)
+    reverse = np.zeros(n_runs, dtype=np.bool_)
+    position = origin
+    for k in range(n_runs):
+        if position is None:
+            index = np.flatnonzero(np.logical_not(visited))[0]
+        else:
+            distances = get_distances(points, position)
+            distances[np.hstack((visited, visited))] = np.inf
+            index = np.argmin(distances)
+        run = index % n_runs
+        order[k], reverse[k] = run, index >= n_runs
+        visited[run] = True
+        position = entries[run] if reverse[k] else exits[run]
+    return order, reverse
+
+
+def improve_order(entries, exits, order, reverse, origin=None,
+                  max_iterations=None, time_budget=None, cancelled=None):
+    """Improves the order of the runs with 2-opt and Or-opt moves.
+
+    2-opt reverses a sequence of runs, flipping each one, and Or-opt moves
+    a sequence of up to three runs to another place, in both directions.
+    The best move of each position is applied until no move shortens the
+    travel or max_iterations positions are examined, so the order does not
+    depend on the speed of the computer. The optional time budget in
+    seconds also stops it, but then the order depends on that speed. The
+    travels between the runs are updated only when a move is applied. The
+    optional cancelled function stops it when it returns True.
+    """
+    n_runs = len(order)
+    nan = np.full(entries.shape[1], np.nan)
+    if origin is None:
+        origin = nan
+    order, reverse = order.copy(), reverse.copy()
+    # Previous exits and next entries of the runs in the current order, NaN
+    # at the path ends, with the exits and entries of the runs as views
+    prevs = np.empty((n_runs + 1, entries.shape[1]))
+    nexts = np.empty((n_runs + 1, entries.shape[1]))
+    prevs[0], nexts[-1] = origin, nan
+    firsts, lasts = nexts[:-1], prevs[1:]
+    flips = reverse.reshape((-1, 1))
+    firsts[:] = np.where(flips, exits[order], entries[order])
+    lasts[:] = np.where(flips, entries[order], exits[order])
+    # Travel distances before each run and after the last one
+    travels = get_distances(prevs, nexts)
+    if max_iterations is None:
+        max_iterations = np.inf
+    if time_budget is None:
+        time_budget = np.inf
+    t0 = time.time()
+    n_iterations = 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n_runs):
+            if (n_iterations >= max_iterations or
+                    time.time() - t0 > time_budget or
+                    (cancelled is not None and cancelled())):
+                return order, reverse
+            n_iterations += 1
+            # 2-opt: reverse the runs i to j
+            j = np.arange(i, n_runs)
+            deltas = (get_distances(prevs[i], lasts[j]) +
+                      get_distances(firsts[i], nexts[j + 1]) -
+                      travels[i] - travels[j + 1])
+            k = np.argmin(deltas)
+            if deltas[k] < -1e-6:
+                j = j[k] + 1
+                firsts[i:j], lasts[i:j] = (lasts[i:j][::-1].copy(),
+                                           firsts[i:j][::-1].copy())
+                order[i:j] = order[i:j][::-1]
+                reverse[i:j] = np.logical_not(reverse[i:j][::-1])
+                travels = get_distances(prevs, nexts)
+                improved = True
+                continue
+            # Or-opt: move the runs i to i + length before the run q, with
+            # the distances of the three lengths calculated at once
+            lengths = min(3, n_runs - i - 1)
+            if lengths < 1:
+                continue
+            ends = lasts[i:i + lengths].reshape((-1, 1, entries.shape[1]))
+            gains = (travels[i] + travels[i + 1:i + lengths + 1] -
+                     get_distances(prevs[i], nexts[i + 1:i + lengths + 1]))
+            to_first = get_distances(prevs, firsts[i]) - travels
+            from_first = get_distances(firsts[i], nexts) - travels
+            from_last = get_distances(ends, nexts)
+            to_last = get_distances(prevs, ends)
+            for length in range(1, lengths + 1):
+                j = i + length
+                gain = gains[length - 1]
+                costs = to_first + from_last[length - 1]
+                costs_reversed = to_last[length - 1] + from_first
+                flip = costs_reversed < costs
+                costs = np.where(flip, costs_reversed, costs)
+                costs[i:j + 1] = np.inf  # Same place or inside the runs
+                q = np.argmin(costs)
+                if costs[q] - gain < -1e-6:
+                    block = range(i, j)
+                    if flip[q]:
+                        block = block[::-1]
+                    rest = range(i) + range(j, n_runs)
+                    p = q if q < i else q - length
+                    indexes = rest[:p] + block + rest[p:]
+                    firsts[:], lasts[:] = firsts[indexes], lasts[indexes]
+                    if flip[q]:
+                        firsts[p:p + length], lasts[p:p + length] = (
+                            lasts[p:p + length].copy(),
+                            firsts[p:p + length].copy())
+                    order, reverse = order[indexes], reverse[indexes]
+                    reverse[p:p + length] ^= flip[q]
+                    travels = get_distances(prevs, nexts)
+                    improved = True
+                    break
+    return order, reverse
+
+
+def order_path(path, origin=None, max_iterations=None, time_budget=None,
+               cancelled=None):
+    """Reorders the runs of the tool path to shorten the travel moves.
+
+    The runs between travel moves are ordered by nearest neighbour from the
+    origin, and improved with 2-opt and Or-opt in max_iterations, one pass
+    over the runs by default, and the optional time budget. Reversed runs
+    are deposited from their last point.
+    """
+    runs = get_runs(path)
+    if len(runs) < 2:
+        return path
+    if max_iterations is None:
+        max_iterations = len(runs)
+    positions = path.positions
+    entries, exits = positions[runs[:, 0]], positions[runs[:, 1] - 1]
+    if origin is not None:
+        origin = np.asarray(origin, dtype=np.float64)
+    order, reverse = get_nearest_order(entries, exits, origin)
+    order, reverse = improve_order(entries, exits, order, reverse, origin,
+                                   max_iterations, time_budget, cancelled)
+    array = path.array
+    pieces = []
+    for run, flip in zip(order, reverse):
+        start, end = runs[run]
+        piece = array[start:end]
+        if flip:
+            piece = piece[::-1].copy()
+            # The travel move goes to the new first point
+            piece['process'] = array['process'][start:end]
+        pieces.append(get_view(piece))
+    return concatenate(pieces)
+
+
+if __name__ == '__main__':
+    import sys
+    from mesh import Mesh
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/flange.stl'
+
+    mesh = Mesh(filename)
+    slice = mesh.get_slice((mesh.z_min + mesh.z_max) / 2)
+    fill_lines = mesh.get_grated(slice, 1.5)
+    regions = mesh.get_fill_regions(fill_lines, 1.5)
+    path = concatenate([mesh.get_path_from_slices([slice]),
+                        mesh.get_path_from_fill_regions(regions, 0, slice,
+                                                        1.5 * 1.5)])
+
+    t0 = time.time()
+    ordered = order_path(path)
+    t1 = time.time()
+    print 'Runs:', len(get_runs(path))
+    print 'Time to order: %.3f s' % (t1 - t0)
+    print 'Travel before: %.1f mm' % get_travel_distance(path)
+    print 'Travel after: %.1f mm' % get_travel_distance(ordered)
@@ -1,4 +1,11 @@
-import ftplib
+import os
+import shutil
+import tempfile
+import numpy as np
+from cStringIO import StringIO
+
+from toolpath import as_toolpath, iter_parts
+from transfer import TransferPool
 
 
 class ABB_Robot():
@@ -6,6 +13,7 @@ class ABB_Robot():
         self.host = '192.168.30.4'
         self.user = 'anonymous'
         self.password = 'anonymous@'
+        self.transfer = None # FTP connections, opened on the first upload
 
         # Powder conditions
         self.carrier_gas = 3
@@ -24,7 +32,12 @@ class ABB_Robot():
         self.tool = [[215.7, -22.4, 473.8], [0.50, 0.0, -0.8660254, 0.0]] # Tool pose
         self.workobject = [[1655, -87, 932], [1, 0, 0, 0]] # Work Object pose
 
-    def path2rapid(self, path):
+        self.config = [-1, 0, -1, 0] # robot configuration of the targets
+        self.max_targets = 10000 # targets of each part module
+        self.modules_path = 'HOME:/ETNA/' # part modules in the controller
+
+    def get_module_parts(self):
+        """Returns the module text around the targets and the moves."""
         RAPID_TEMPLATE  = 'MODULE Etna\n'
         RAPID_TEMPLATE += '\n'
         RAPID_TEMPLATE += '    PERS tooldata toolEtna:=%(tool)s;\n'
@@ -76,41 +89,152 @@ class ABB_Robot():
         RAPID_TEMPLATE += 'ENDPROC\n'
         RAPID_TEMPLATE += '\n'
         RAPID_TEMPLATE += 'ENDMODULE\n'
+        tool = '[TRUE,[[%.1f,%.1f,%.1f],[%f,%f,%f,%f]],[20,[70,30,123.5],[0,0,1,0],1,0,1]]' %(self.tool[0][0], self.tool[0][1], self.tool[0][2], self.tool[1][0], self.tool[1][1], self.tool[1][2], self.tool[1][3])
+        wobj = '[FALSE,TRUE,"",[[%.1f,%.1f,%.1f],[%f,%f,%f,%f]],[[0,0,0],[1,0,0,0]]]' %(self.workobject[0][0], self.workobject[0][1], self.workobject[0][2], self.workobject[1][0], self.workobject[1][1], self.workobject[1][2], self.workobject[1][3])
+
+        module = RAPID_TEMPLATE %{'tool': tool,
+                                  'wobj': wobj,
+                                  'speed': self.track_speed,
+                                  'targets': '\0',
+                                  'moves': '\0',
+                                  'carrier': self.carrier_gas,
+                                  'stirrer': self.stirrer,
+                                  'turntable': self.turntable,
+                                  'power': self.power}
+        header, middle, footer = module.split('\0')
+        return (header, middle + '!Reset doLDLStartST;\n',
+                '\n\n!Reset doLDLStartST;' + footer)
+
+    def get_part_parts(self, k):
+        """Returns the text around the targets and the moves of a part.
+
+        Part modules only have the targets and the cladding routine of the
+        part, using the data declared in the main module.
+        """
+        header = 'MODULE EtnaPart%i\n' % k
+        middle = '\n\nPROC cladding%i()\n    !Reset doLDLStartST;\n' % k
+        footer = '\nENDPROC\n\nENDMODULE\n'
+        return header, middle, footer
+
+    def get_rapid_lines(self, path, start=0, next_process=False):
+        """Returns the target and move lines of the path.
+
+        Targets are numbered from start, and the laser is switched off in
+        the last point unless the next point is a process one. The lines
+        are formatted at once for the whole path.
+        """
+        n_points = len(path)
+        indexes = np.arange(start, start + n_points)
         # Target points definition
-        targets = ''
-        for k in range(len(path)):
-            p, q, b = path[k]
-            targets = '\n'.join([targets, '    CONST robtarget T%i:=[[%f,%f,%f],[%f,%f,%f,%f],[-1,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];' %(k, p[0], p[1], p[2], q[3], q[0], q[1], q[2])])
+        config = '[%i,%i,%i,%i]' %tuple(self.config)
+        target = '\n    CONST robtarget T%i:=[[%f,%f,%f],[%f,%f,%f,%f],' + config + ',[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];'
+        values = np.column_stack((indexes, path.positions,
+                                  path.orientations[:, [3, 0, 1, 2]]))
+        targets = (target * n_points) % tuple(values.ravel().tolist())
         # Movement definition
-        moves = '!Reset doLDLStartST;\n'
-        for k in range(len(path)):
-            p, q, process = path[k]
-            if process:
-                #moves = '\n'.join([moves, '    Set doLDLStartST;'])
-                #moves = '\n'.join([moves, '    MoveL T%i,%s,%s,toolEtna\WObj:=wobjEtna;' %(k, self.speed, self.zone)])
-                if k < len(path)-1 and path[k+1][2]:
-                    # If the track continues in the next point. Don't OFF the laser.
-                    moves = '\n'.join([moves, '    TriggL T%i,%s,laserON,%s,toolEtna\WObj:=wobjEtna;' %(k, self.speed, self.zone)])
-                else:
-                    moves = '\n'.join([moves, '    TriggL T%i,%s,laserOFF,%s,toolEtna\WObj:=wobjEtna;' %(k, self.speed, self.zone)])
-            else:
-                #moves = '\n'.join([moves, '    Reset doLDLStartST;'])
-                #moves = '\n'.join([moves, '    MoveL T%i,%s,%s,toolEtna\WObj:=wobjEtna;' %(k, self.travel_speed, self.travel_zone)])
-                moves = '\n'.join([moves, '    TriggL T%i,%s,laserON,%s,toolEtna\WObj:=wobjEtna;' %(k, self.travel_speed, self.travel_zone)])
-        moves = '\n'.join([moves, '\n!Reset doLDLStartST;'])
+        process_on = '\n    TriggL T%%i,%s,laserON,%s,toolEtna\WObj:=wobjEtna;' %(self.speed, self.zone)
+        # If the track does not continue in the next point, OFF the laser.
+        process_off = '\n    TriggL T%%i,%s,laserOFF,%s,toolEtna\WObj:=wobjEtna;' %(self.speed, self.zone)
+        travel = '\n    TriggL T%%i,%s,laserON,%s,toolEtna\WObj:=wobjEtna;' %(self.travel_speed, self.travel_zone)
+        processes = np.append(path.processes, next_process)
+        kinds = np.where(processes[:-1], np.where(processes[1:], 1, 2), 0)
+        formats = np.array([travel, process_on, process_off], dtype=object)
+        moves = ''.join(formats[kinds]) % tuple(indexes.tolist())
+        return targets, moves
 
-        tool = '[TRUE,[[%.1f,%.1f,%.1f],[%f,%f,%f,%f]],[20,[70,30,123.5],[0,0,1,0],1,0,1]]' %(self.tool[0][0], self.tool[0][1], self.tool[0][2], self.tool[1][0], self.tool[1][1], self.tool[1][2], self.tool[1][3])
-        wobj = '[FALSE,TRUE,"",[[%.1f,%.1f,%.1f],[%f,%f,%f,%f]],[[0,0,0],[1,0,0,0]]]' %(self.workobject[0][0], self.workobject[0][1], self.workobject[0][2], self.workobject[1][0], self.workobject[1][1], self.workobject[1][2], self.workobject[1][3])
+    def iter_rapid(self, paths, start=0):
+        """Yields the (targets, moves) RAPID lines of each tool path.
+
+        Targets are numbered across the paths from start, and each path is
+        yielded when the first point of the next one is known.
+        """
+        previous = None
+        for path in paths:
+            path = as_toolpath(path)
+            if len(path) == 0:
+                continue
+            if previous is not None:
+                yield self.get_rapid_lines(previous, start, path.processes[0])
+                start += len(previous)
+            previous = path
+        if previous is not None:
+            yield self.get_rapid_lines(previous, start)
+
+    def write_module(self, f, paths, parts=None, start=0):
+        """Writes the RAPID module of the tool paths in the file object.
 
-        return RAPID_TEMPLATE %{'tool': tool,
-                                'wobj': wobj,
-                                'speed': self.track_speed,
-                                'targets': targets,
-                                'moves': moves,
-                                'carrier': self.carrier_gas,
-                                'stirrer': self.stirrer,
-                                'turntable': self.turntable,
-                                'power': self.power}
+        Target lines are written as each path is formatted, and the move
+        lines, which follow all the targets in the module, are spooled in a
+        temporary file, so the paths can be streamed by layer. The module
+        text around them is the main module one, unless other parts are
+        given.
+        """
+        if parts is None:
+            parts = self.get_module_parts()
+        header, middle, footer = parts
+        f.write(header)
+        spool = tempfile.TemporaryFile()
+        try:
+            for targets, moves in self.iter_rapid(paths, start):
+                f.write(targets)
+                spool.write(moves)
+            f.write(middle)
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+        finally:
+            spool.close()
+        f.write(footer)
+
+    def write_file(self, filename, paths):
+        """Writes the RAPID module file, raising IOError when it fails."""
+        with open(filename, 'w') as f:
+            self.write_module(f, paths)
+
+    def write_part(self, filename, part, k):
+        """Writes the paths of the part k in its EtnaPart module file.
+
+        Targets are numbered from 0 in each part, as the parts are unloaded
+        before the next one is loaded, so a part does not change when the
+        previous ones do.
+        """
+        with open(filename, 'w') as f:
+            self.write_module(f, part, self.get_part_parts(k))
+
+    def write_main(self, filename, n_parts):
+        """Writes the main module loading, running and unloading the parts."""
+        loads = ''
+        for k in range(1, n_parts + 1):
+            module = self.modules_path + 'EtnaPart%i.mod' % k
+            loads += '\n    Load \\Dynamic, "%s";' % module
+            loads += '\n    %%"cladding%i"%%;' % k
+            loads += '\n    UnLoad "%s";' % module
+        header, middle, footer = self.get_module_parts()
+        with open(filename, 'w') as f:
+            f.write(header + middle + loads + footer)
+
+    def write_files(self, filename, paths):
+        """Writes the tool paths in part modules loaded by the main one.
+
+        The paths are split in parts of at most max_targets at the layer
+        boundaries, or at the runs of the layers too long for a part. Each
+        part is written in its EtnaPart module, next to the main module,
+        which loads, runs and unloads them in sequence. Returns the
+        filenames of the main module and the parts, raising IOError when
+        a module cannot be written.
+        """
+        directory = os.path.dirname(filename)
+        filenames = []
+        for k, part in enumerate(iter_parts(paths, self.max_targets)):
+            filenames.append(os.path.join(directory,
+                                          'EtnaPart%i.mod' % (k + 1)))
+            self.write_part(filenames[-1], part, k + 1)
+        self.write_main(filename, len(filenames))
+        return [filename] + filenames
+
+    def path2rapid(self, path):
+        f = StringIO()
+        self.write_module(f, [path])
+        return f.getvalue()
 
     def save_file(self, filename, routine):
         try:
@@ -119,16 +243,27 @@ class ABB_Robot():
         except IOError:
             pass
 
+    def get_transfer(self):
+        if self.transfer is None:
+            self.transfer = TransferPool(self.host, self.user, self.password)
+        return self.transfer
+
+    def upload_files(self, filenames, directory):
+        """Uploads the files to the robot, returning the ones not uploaded.
+
+        The FTP connections are kept for the next uploads, and the files
+        are uploaded two at a time, in order.
+        """
+        failed = self.get_transfer().upload_files(filenames, directory)
+        for filename in filenames:
+            if filename in failed:
+                print 'The file %s was not uploaded.' % filename
+            else:
+                print 'The file %s was upload sucessful!' % filename
+        return failed
+
     def upload_file(self, filename, directory):
-        try:
-            ftp = ftplib.FTP(self.host, self.user, self.password, timeout=1)
-            ftp.cwd(directory)
-            ftp.storbinary('STOR ' + filename, open(filename,'rb'))
-            print 'The file was upload sucessful!'
-            print ftp.retrlines('LIST')
-            ftp.quit()
-        except IOError:
-            print 'File transfered to the robot.'
+        return not self.upload_files([filename], directory)
 
 
 
@@ -0,0 +1,193 @@
+import re
+import numpy as np
+from cStringIO import StringIO
+
+from toolpath import as_toolpath
+
+
+LAYER_ROUTINE  = '\n\nPROC claddingLayer(robtarget targets{*}, num runs{*,*})\n'
+LAYER_ROUTINE += '    VAR num first;\n'
+LAYER_ROUTINE += '    VAR num last;\n'
+LAYER_ROUTINE += '\n'
+LAYER_ROUTINE += '    FOR r FROM 1 TO Dim(runs, 1) DO\n'
+LAYER_ROUTINE += '        first := runs{r, 1};\n'
+LAYER_ROUTINE += '        last := runs{r, 2};\n'
+LAYER_ROUTINE += '        IF runs{r, 3} = 1 THEN\n'
+LAYER_ROUTINE += '            TriggL targets{first},%(travel_speed)s,laserON,%(travel_zone)s,toolEtna\WObj:=wobjEtna;\n'
+LAYER_ROUTINE += '            first := first + 1;\n'
+LAYER_ROUTINE += '        ENDIF\n'
+LAYER_ROUTINE += '        IF first < last THEN\n'
+LAYER_ROUTINE += '            FOR i FROM first TO last - 1 DO\n'
+LAYER_ROUTINE += '                TriggL targets{i},%(speed)s,laserON,%(zone)s,toolEtna\WObj:=wobjEtna;\n'
+LAYER_ROUTINE += '            ENDFOR\n'
+LAYER_ROUTINE += '        ENDIF\n'
+LAYER_ROUTINE += '        IF first <= last THEN\n'
+LAYER_ROUTINE += '            TriggL targets{last},%(speed)s,laserOFF,%(zone)s,toolEtna\WObj:=wobjEtna;\n'
+LAYER_ROUTINE += '        ENDIF\n'
+LAYER_ROUTINE += '    ENDFOR\n'
+LAYER_ROUTINE += 'ENDPROC'
+
+
+def get_runs(path):
+    """Returns the [first, last, travel] index ranges of the laser runs.
+
+    Each run starts in a travel point, or in the first point of the path,
+    and ends before the next travel point. Indexes start at 1, as RAPID
+    arrays do.
+    """
+    processes = path.processes
+    firsts = np.flatnonzero(np.logical_not(processes))
+    if len(firsts) == 0 or firsts[0] != 0:
+        firsts = np.append(0, firsts)
+    lasts = np.append(firsts[1:], len(path)) - 1
+    travels = np.logical_not(processes[firsts])
+    return np.column_stack((firsts + 1, lasts + 1, travels))
+
+
+def get_array_lines(robot, path, k):
+    """Returns the target and run arrays of the layer path, and its call.
+
+    The laser is switched off at the end of each run, also in the last
+    point of the layer, as the path of the next layer is not known.
+    """
+    n_points = len(path)
+    config = '[%i,%i,%i,%i]' % tuple(robot.config)
+    target = '\n        [[%f,%f,%f],[%f,%f,%f,%f],' + config + ',[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]],'
+    values = np.column_stack((path.positions,
+                              path.orientations[:, [3, 0, 1, 2]]))
+    targets = (target * n_points) % tuple(values.ravel().tolist())
+    runs = get_runs(path)
+    arrays = '\n    CONST robtarget L%i{%i}:=[%s];' % (k, n_points, targets[:-1])
+    arrays += '\n    CONST num R%i{%i,3}:=[%s];' % (
+        k, len(runs), ','.join(['[%i,%i,%i]' % tuple(run) for run in runs]))
+    call = '\n    claddingLayer L%i, R%i;' % (k, k)
+    return arrays, call
+
+
+def write_module(robot, f, paths):
+    """Writes the RAPID module of the tool paths with robtarget arrays.
+
+    Each path has an array of targets and an array of runs, driven by the
+    FOR loops of the claddingLayer routine, so the module has two data
+    declarations and one line of the cladding routine per path, instead of
+    one target and one move per point.
+    """
+    header, middle, footer = robot.get_module_parts()
+    f.write(header)
+    calls = []
+    for path in paths:
+        path = as_toolpath(path)
+        if len(path) == 0:
+            continue
+        arrays, call = get_array_lines(robot, path, len(calls) + 1)
+        f.write(arrays)
+        calls.append(call)
+    f.write(LAYER_ROUTINE % {'speed': robot.speed, 'zone': robot.zone,
+                             'travel_speed': robot.travel_speed,
+                             'travel_zone': robot.travel_zone})
+    f.write(middle)
+    f.write(''.join(calls))
+    f.write(footer)
+
+
+def paths2rapid(robot, paths):
+    f = StringIO()
+    write_module(robot, f, paths)
+    return f.getvalue()
+
+
+def parse_values(text):
+    return [float(value) for value in text.split(',')]
+
+
+def parse_module(module):
+    """Parses the moves of a RAPID module of targets or arrays.
+
+    Returns the positions and orientations (w, x, y, z) of the targets of
+    the moves, in the order they are executed, and their speeds and
+    triggers. The loops of the array modules are expanded as the
+    claddingLayer routine runs them.
+    """
+    target = r'\[\[([^\]]*)\],\[([^\]]*)\],'
+    points, moves = [], []
+    if 'claddingLayer' in module:
+        layer_moves = re.findall(r'TriggL targets\{\w+\},(\w+),(\w+),',
+                                 module)
+        travel, process_on, process_off = layer_moves
+        targets = dict(re.findall(r'CONST robtarget (\w+)\{\d+\}:=\[(.*?)\];',
+                                  module, re.S))
+        runs = dict(re.findall(r'CONST num (\w+)\{\d+,3\}:=\[(.*?)\];',
+                               module))
+        for name, runs_name in re.findall(r'\n    claddingLayer (\w+), (\w+);',
+                                          module):
+            layer = re.findall(target, targets[name])
+            values = re.findall(r'\[(\d+),(\d+),(\d+)\]', runs[runs_name])
+            for first, last, is_travel in values:
+                first, last = int(first), int(last)
+                if is_travel == '1':
+                    points.append(layer[first - 1])
+                    moves.append(travel)
+                    first += 1
+                for i in range(first, last):
+                    points.append(layer[i - 1])
+                    moves.append(process_on)
+                if first <= last:
+                    points.append(layer[last - 1])
+                    moves.append(process_off)
+    else:
+        targets = dict([(name, point) for name, point in zip(
+            re.findall(r'CONST robtarget (\w+):=\[', module),
+            re.findall(target, module))])
+        for name, speed, trigger in re.findall(r'TriggL (\w+),(\w+),(\w+),',
+                                               module):
+            points.append(targets[name])
+            moves.append((speed, trigger))
+    positions = np.array([parse_values(point[0]) for point in points])
+    orientations = np.array([parse_values(point[1]) for point in points])
+    speeds = [move[0] for move in moves]
+    triggers = [move[1] for move in moves]
+    return positions.reshape((-1, 3)), orientations.reshape((-1, 4)), \
+        speeds, triggers
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from rapid import ABB_Robot
+    from robpath import RobPath
+
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = '../../data/models_stl/flange.stl'
+
+    robpath = RobPath()
+    robpath.load_mesh(filename)
+    robpath.set_track(0.5, 2.5, 0.3)
+    robpath.get_contours_path()
+    layers = robpath.path.split_layers()
+    robot = ABB_Robot()
+
+    t0 = time.time()
+    f = StringIO()
+    robot.write_module(f, layers)
+    targets_module = f.getvalue()
+    t1 = time.time()
+    arrays_module = paths2rapid(robot, layers)
+    t2 = time.time()
+    print 'Points:', len(robpath.path), 'Layers:', len(layers)
+    print 'Targets module: %i bytes in %.3f s' % (len(targets_module), t1 - t0)
+    print 'Arrays module: %i bytes in %.3f s' % (len(arrays_module), t2 - t1)
+
+    t0 = time.time()
+    moves1 = parse_module(targets_module)
+    t1 = time.time()
+    moves2 = parse_module(arrays_module)
+    t2 = time.time()
+    print 'Parse time: %.3f s, %.3f s' % (t1 - t0, t2 - t1)
+    print 'Same positions:', np.array_equal(moves1[0], moves2[0])
+    print 'Same orientations:', np.array_equal(moves1[1], moves2[1])
+    print 'Same speeds and triggers:', (moves1[2] == moves2[2] and
+                                        moves1[3] == moves2[3])
+    print 'Path positions:', np.allclose(moves2[0], robpath.path.positions,
+                                         atol=1e-6)
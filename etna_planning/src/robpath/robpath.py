@@ -1,22 +1,45 @@
+import os
 import numpy as np
 
+import analysis
+import manifest
 import mesh
+import offset
+import ordering
+from cache import MeshCache, SliceCache
 from rapid import ABB_Robot
+from toolpath import ToolPath
 
 
 class RobPath():
     def __init__(self):
         self.mesh = None
         self.filled = True
+        self.processes = 1
+        self.hatch_angle = 0.0
+        self.hatch_rotation = 0.0
+        self.offsets = 0
+        self.tolerance = 0.01
+        self.indexed = False
+        self.ordered = True
+        self.order_iterations = None  # One pass over the runs
+        self.order_budget = None
         self.rob_parser = ABB_Robot()
+        self.mesh_cache = MeshCache()
+        self.slice_cache = SliceCache()
+        self.offset_cache = SliceCache()
 
     def load_mesh(self, filename):
-        self.mesh = mesh.Mesh(filename)
+        self.mesh = mesh.Mesh(filename, cache=self.mesh_cache)
+        self.mesh.slice_cache = self.slice_cache
+        self.mesh.tolerance = self.tolerance
+        if self.indexed:
+            self.mesh.index_mesh()
         # TODO: Change bpoints.
         self.mesh.translate(np.float32([20, 20, 0]))
         position = self.mesh.bpoint1  # Rename to position
         size = self.mesh.bpoint2 - self.mesh.bpoint1  # Change by size
-        print np.vstack(self.mesh.triangles)
+        print 'Triangles:', len(self.mesh.triangles)
 
     def translate_mesh(self, position):
         self.mesh.translate(position)
@@ -38,54 +61,181 @@ class RobPath():
         self.track_distance = (1 - overlap) * width
         print 'Track distance:', self.track_distance
 
+    def set_hatch(self, angle, rotation=0.0):
+        """Sets the fill hatch angle and its rotation by layer in degrees."""
+        self.hatch_angle = angle
+        self.hatch_rotation = rotation
+
+    def set_offsets(self, offsets):
+        """Sets the number of inward offsets of the contours path."""
+        self.offsets = offsets
+
+    def set_tolerance(self, tolerance):
+        """Sets the chordal tolerance of the slice contours in mm."""
+        self.tolerance = tolerance
+        if self.mesh is not None:
+            self.mesh.tolerance = tolerance
+
+    def set_indexed(self, indexed=True):
+        """Sets the slicing of the indexed mesh.
+
+        The segments of the slices are chained by the welded mesh edges
+        they cross, instead of by their quantized end points.
+        """
+        self.indexed = indexed
+        if self.mesh is not None:
+            if indexed:
+                self.mesh.index_mesh()
+            else:
+                self.mesh.vertices, self.mesh.faces = None, None
+
+    def set_ordering(self, ordered=True, max_iterations=None,
+                     time_budget=None):
+        """Sets the ordering of each layer path, limited in iterations.
+
+        By default the runs of each layer are improved in one pass, as the
+        next ones shorten the travel much less for their time. The optional time budget in seconds makes the order depend on the
+        speed of the computer, and so the RAPID modules.
+        """
+        self.ordered = ordered
+        self.order_iterations = max_iterations
+        self.order_budget = time_budget
+
+    def set_processes(self, processes):
+        """Sets the slicing processes, None to use all the CPUs."""
+        self.processes = processes
+
     def set_powder(self, carrier_gas, stirrer, turntable):
         self.rob_parser.carrier_gas = carrier_gas
         self.rob_parser.stirrer = stirrer
         self.rob_parser.turntable = turntable
 
+    def get_levels(self):
+        return mesh.get_range_values(self.mesh.z_min, self.mesh.z_max,
+                                     self.track_height)
+
+    def get_layer_path(self, slice, k, filled=True, pair=False):
+        """Calculates the tool path of the layer slice."""
+        if filled:
+            angle = np.radians((self.hatch_angle +
+                                k * self.hatch_rotation) % 180)
+            fill_lines = self.mesh.get_grated(slice, self.track_distance,
+                                              angle)
+            # Reverse the order of the slicer fill lines
+            if pair:
+                fill_lines.reverse()
+            regions = self.mesh.get_fill_regions(fill_lines,
+                                                 self.track_distance, angle)
+            return self.mesh.get_path_from_fill_regions(
+                regions, k, slice, 1.5 * self.track_distance)
+        else:
+            offsets = offset.get_offsets(slice, self.track_distance,
+                                         self.offsets, cache=self.offset_cache)
+            return self.mesh.get_path_from_slices([slice] + offsets, k)
+
+    def iter_layer_paths(self, filled=None, cancelled=None):
+        """Yields the (k, slice, tool path) of each layer as it is sliced.
+
+        Only the slices being calculated are kept in memory, so the layers
+        can be drawn or written while the next ones are sliced. Each layer
+        path is ordered from the end of the previous one. The optional
+        cancelled function is checked while each layer is planned, stopping
+        without the layer when it returns True.
+        """
+        if filled is None:
+            filled = self.filled
+        self.travel = [0.0, 0.0]
+        pair = False
+        origin = None
+        slicer = self.mesh.iter_cached_slices(self.get_levels(),
+                                              self.processes)
+        try:
+            for k, slice in enumerate(slicer):
+                tool_path = ToolPath()
+                if slice is not None:
+                    if cancelled is not None and cancelled():
+                        return
+                    tool_path = self.get_layer_path(slice, k, filled, pair)
+                    tool_path = self.order_path(tool_path, origin, cancelled)
+                    pair = not pair
+                    if len(tool_path):
+                        origin = tool_path.positions[-1]
+                if cancelled is not None and cancelled():
+                    return
+                yield k, slice, tool_path
+        finally:
+            slicer.close()
+
+    def iter_rapid(self, filled=None):
+        """Yields the (targets, moves) RAPID lines of each layer."""
+        paths = (tool_path for k, slice, tool_path
+                 in self.iter_layer_paths(filled))
+        return self.rob_parser.iter_rapid(paths)
+
     def init_process(self):
         self.k = 0
-        self.path = []
+        self.path = ToolPath()
         self.slices = []
-        self.pair = False
-        self.levels = mesh.get_range_values(self.mesh.z_min,
-                                            self.mesh.z_max,
-                                            self.track_height)
+        self.levels = self.get_levels()
+        self.layers = self.iter_layer_paths()
 
-    def update_process(self):
-        slice = self.mesh.get_slice(self.levels[self.k])
+    def add_layer(self, k, slice, tool_path):
+        """Adds the planned layer to the process path."""
         if slice is not None:
-            if self.filled:
-                fill_lines = self.mesh.get_grated(slice, self.track_distance)
-
-                # Reverse the order of the slicer fill lines
-                if self.pair:
-                    fill_lines.reverse()
-                self.pair = not self.pair
-
-                tool_path = self.mesh.get_path_from_fill_lines(fill_lines)
-            else:
-                tool_path = self.mesh.get_path_from_slices([slice])
             self.slices.append(slice)
             self.path.extend(tool_path)
-        self.k = self.k + 1
+        self.k = k + 1
+
+    def update_process(self):
+        self.add_layer(*next(self.layers))
         print 'k, levels:', self.k, len(self.levels)
+        print 'Travel before, after: %.1f, %.1f mm' % tuple(self.travel)
 
     def get_contours_path(self):
         self.k = 0
-        self.path = []
+        self.path = ToolPath()
         self.slices = []
-        self.pair = False
-        self.levels = mesh.get_range_values(self.mesh.z_min,
-                                            self.mesh.z_max,
-                                            self.track_height)
-        slices = [self.mesh.get_slice(level) for level in self.levels]
-        self.path = self.mesh.get_path_from_slices(slices)
+        self.levels = self.get_levels()
+        for k, slice, tool_path in self.iter_layer_paths(filled=False):
+            self.path.extend(tool_path)
+        print 'Travel before, after: %.1f, %.1f mm' % tuple(self.travel)
+
+    def order_path(self, tool_path, origin=None, cancelled=None):
+        """Reorders the layer path to start near the origin."""
+        if not self.ordered or not len(tool_path):
+            return tool_path
+        travel = ordering.get_travel_distance(tool_path, origin)
+        tool_path = ordering.order_path(tool_path, origin,
+                                        self.order_iterations,
+                                        self.order_budget, cancelled)
+        self.travel[0] += travel
+        self.travel[1] += ordering.get_travel_distance(tool_path, origin)
+        return tool_path
+
+    def get_statistics(self, acceleration=500.0):
+        """Returns the deposition statistics of each layer of the path."""
+        process_speed, travel_speed = analysis.get_robot_speeds(
+            self.rob_parser)
+        return analysis.get_path_statistics(self.path, process_speed,
+                                            travel_speed, acceleration)
 
     def save_rapid(self):
+        """Saves and uploads the RAPID modules of the path that changed.
+
+        Paths longer than the max targets of the robot are split by layers
+        in part modules, loaded by the main one. Only the modules whose
+        fingerprint changed since the last save are written and uploaded,
+        and the manifest beside the main module keeps the fingerprints of
+        the uploaded ones.
+        """
         filename = 'etna.mod'
         directory = 'ETNA'
-        routine = self.rob_parser.path2rapid(self.path)
-        self.rob_parser.save_file(filename, routine)
-        self.rob_parser.upload_file(filename, directory)
-        print routine
+        filenames, changed, fingerprints = manifest.write_modules(
+            self.rob_parser, filename, self.path.split_layers())
+        failed = self.rob_parser.upload_files(changed, directory)
+        for name in failed:
+            del fingerprints['modules'][os.path.basename(name)]
+        manifest.save_manifest(manifest.get_manifest_name(filename),
+                               fingerprints)
+        print 'RAPID module:', filename, len(self.path), 'targets,',
+        print len(changed), 'of', len(filenames), 'files changed'
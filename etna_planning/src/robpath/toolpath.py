@@ -0,0 +1,240 @@
+import numpy as np
+
+
+PATH_DTYPE = np.dtype([('position', np.float64, 3),
+                       ('orientation', np.float64, 4),
+                       ('process', np.bool_),
+                       ('layer', np.int32),
+                       ('speed', np.float32),
+                       ('power', np.float32)])
+
+
+class ToolPath():
+    """Tool path stored in one structured array.
+
+    Each point has the position, the orientation quaternion (x, y, z, w),
+    the process flag, the layer index and the optional speed and power, NaN
+    when the robot defaults are used. The array grows by doubling its
+    capacity, and the columns, slices and layers are views of it. Indexing
+    a point returns the [position, orientation, process] of the old lists.
+    """
+    def __init__(self, path=None, capacity=256):
+        self.data = np.zeros(capacity, dtype=PATH_DTYPE)
+        self.size = 0
+        if path is not None:
+            self.extend(path)
+
+    @property
+    def array(self):
+        return self.data[:self.size]
+
+    @property
+    def positions(self):
+        return self.data['position'][:self.size]
+
+    @property
+    def orientations(self):
+        return self.data['orientation'][:self.size]
+
+    @property
+    def processes(self):
+        return self.data['process'][:self.size]
+
+    @property
+    def layers(self):
+        return self.data['layer'][:self.size]
+
+    @property
+    def speeds(self):
+        return self.data['speed'][:self.size]
+
+    @property
+    def powers(self):
+        return self.data['power'][:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return get_view(self.array[index])
+        point = self.array[index]
+        return [point['position'], point['orientation'], point['process']]
+
+    def __iter__(self):
+        for k in range(self.size):
+            yield self[k]
+
+    def reserve(self, size):
+        """Doubles the capacity until the size fits in the array."""
+        capacity = len(self.data)
+        if size > capacity:
+            while capacity < size:
+                capacity = 2 * max(capacity, 1)
+            data = np.zeros(capacity, dtype=PATH_DTYPE)
+            data[:self.size] = self.array
+            self.data = data
+
+    def append(self, position, orientation, process, layer=0,
+               speed=np.nan, power=np.nan):
+        """Appends a point to the end of the path."""
+        self.reserve(self.size + 1)
+        self.data[self.size] = (position, orientation, process, layer,
+                                speed, power)
+        self.size += 1
+
+    def append_arrays(self, positions, orientations, processes, layers=0,
+                      speeds=np.nan, powers=np.nan):
+        """Appends the points of the arrays, broadcasting the scalars."""
+        n_points = len(positions)
+        self.reserve(self.size + n_points)
+        points = self.data[self.size:self.size + n_points]
+        points['position'] = positions
+        points['orientation'] = orientations
+        points['process'] = processes
+        points['layer'] = layers
+        points['speed'] = speeds
+        points['power'] = powers
+        self.size += n_points
+
+    def extend(self, path):
+        """Appends the points of a tool path or a list of points."""
+        if isinstance(path, ToolPath):
+            array = path.array
+        else:
+            array = np.zeros(len(path), dtype=PATH_DTYPE)
+            array['speed'], array['power'] = np.nan, np.nan
+            for k, (position, orientation, process) in enumerate(path):
+                array['position'][k] = position
+                array['orientation'][k] = orientation
+                array['process'][k] = process
+        self.reserve(self.size + len(array))
+        self.data[self.size:self.size + len(array)] = array
+        self.size += len(array)
+
+    def get_layer_values(self):
+        """Returns the sorted layer indexes of the path."""
+        return np.unique(self.layers)
+
+    def get_layer(self, layer):
+        """Returns the points of the layer, as a view when contiguous."""
+        layers = self.layers
+        indexes = np.flatnonzero(layers == layer)
+        if len(indexes) == 0:
+            return ToolPath()
+        if indexes[-1] - indexes[0] + 1 == len(indexes):
+            return get_view(self.array[indexes[0]:indexes[-1] + 1])
+        return get_view(self.array[indexes])
+
+    def split_layers(self):
+        """Returns the views of the consecutive points of each layer."""
+        starts = np.flatnonzero(np.diff(self.layers)) + 1
+        bounds = np.concatenate(([0], starts, [self.size]))
+        return [self[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1)
+                if bounds[k + 1] > bounds[k]]
+
+    def to_list(self):
+        """Returns the path as a list of [position, orientation, process]."""
+        return [[point['position'].copy(), point['orientation'].copy(),
+                 bool(point['process'])] for point in self.array]
+
+
+def get_view(array):
+    """Returns a tool path sharing the structured array.
+
+    Appending to the view copies the array first, so the source path is
+    never modified by its growth.
+    """
+    path = ToolPath(capacity=0)
+    path.data = array
+    path.size = len(array)
+    return path
+
+
+def as_toolpath(path):
+    """Returns the path as a tool path, converting the lists of points."""
+    if isinstance(path, ToolPath):
+        return path
+    return ToolPath(path)
+
+
+def iter_parts(paths, max_points):
+    """Groups the paths in parts of at most max_points.
+
+    Paths are kept whole when they fit in a part, and longer ones are split
+    at the start of their runs. A run longer than a part is split in a
+    point, repeated as the travel move to the start of the next part, so
+    parts must have at least two points.
+    """
+    if max_points < 2:
+        raise ValueError('Parts must have at least 2 points (%i)' % max_points)
+    part, size = [], 0
+    for path in paths:
+        path = as_toolpath(path)
+        if size + len(path) > max_points and part:
+            yield part
+            part, size = [], 0
+        start = 0
+        while len(path) - start > max_points:
+            travels = np.flatnonzero(np.logical_not(
+                path.processes[start + 1:start + max_points + 1]))
+            if len(travels):
+                end = start + 1 + travels[-1]
+            else:
+                end = start + max_points
+            yield [_get_piece(path, start, end)]
+            start = end if len(travels) else end - 1
+        if start < len(path):
+            part.append(_get_piece(path, start, len(path)))
+            size += len(path) - start
+    if part:
+        yield part
+
+
+def _get_piece(path, start, end):
+    piece = path[start:end]
+    if start > 0 and piece.processes[0]:
+        piece = get_view(piece.array.copy())
+        piece.processes[0] = False
+    return piece
+
+
+def concatenate(paths):
+    """Joins the tool paths in a new one."""
+    arrays = [as_toolpath(path).array for path in paths]
+    if not arrays:
+        return ToolPath()
+    array = np.concatenate(arrays)
+    path = ToolPath(capacity=len(array))
+    path.data[:] = array
+    path.size = len(array)
+    return path
+
+
+if __name__ == '__main__':
+    import time
+
+    orientation = np.array((0.0, 0.0, 0.0, 1.0))
+    n_points = 1000000
+
+    t0 = time.time()
+    path = ToolPath()
+    for k in range(n_points):
+        path.append((k, 0, 0), orientation, k % 2, layer=k / 1000)
+    t1 = time.time()
+    print 'Time to append %i points: %.3f s' % (n_points, t1 - t0)
+
+    positions = np.random.rand(n_points, 3)
+    processes = np.random.rand(n_points) > 0.5
+    t0 = time.time()
+    path = ToolPath()
+    for k in range(10):
+        path.append_arrays(positions, orientation, processes, layers=k)
+    t1 = time.time()
+    print 'Time to append %i arrays: %.3f s' % (10, t1 - t0)
+
+    layer = path.get_layer(5)
+    print 'Layer 5:', len(layer), np.may_share_memory(layer.data, path.data)
+    print 'Layers:', path.get_layer_values()
+    print 'Concatenated:', len(concatenate([path, layer, path[:10]]))
+    print 'First point:', path[0]
@@ -0,0 +1,189 @@
+import os
+import time
+import Queue
+import ftplib
+import threading
+
+
+class FTPTransfer():
+    """Uploads files through a persistent FTP connection.
+
+    The connection is opened on the first upload and kept while it answers.
+    Failed uploads are retried with an exponential backoff, resuming with
+    REST from the size already stored by the failed attempt, and each
+    upload is verified with the remote size given by SIZE, or by LIST when
+    SIZE is not supported. Only the retries after the STOR of the same
+    upload was accepted resume, as the remote file can be an older version.
+    """
+    def __init__(self, host, user='anonymous', password='anonymous@',
+                 port=21, timeout=2, retries=2, backoff=0.5):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.blocksize = 8192
+        self.resume = True
+        self.ftp = None
+        self.home = None
+        self.started = False # STOR of the current upload accepted
+
+    def connect(self):
+        """Returns the connection, opening it again when it is lost."""
+        if self.ftp is not None:
+            try:
+                self.ftp.voidcmd('NOOP')
+                return self.ftp
+            except ftplib.all_errors:
+                self.close()
+        ftp = ftplib.FTP(timeout=self.timeout)
+        ftp.connect(self.host, self.port)
+        ftp.login(self.user, self.password)
+        self.home = ftp.pwd()
+        self.ftp = ftp
+        return ftp
+
+    def close(self):
+        if self.ftp is not None:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+            self.ftp = None
+
+    def get_size(self, name):
+        """Returns the size of the remote file, or None when it is missing."""
+        try:
+            self.ftp.voidcmd('TYPE I')
+            return self.ftp.size(name)
+        except ftplib.error_perm:
+            pass
+        lines = []
+        try:
+            self.ftp.retrlines('LIST ' + name, lines.append)
+        except ftplib.error_perm:
+            return None
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 4 and fields[-1] == name and fields[4].isdigit():
+                return int(fields[4])
+        return None
+
+    def store(self, filename, name, size, resume=False):
+        """Stores the file, from the remote size when resuming."""
+        offset = 0
+        if resume and self.resume:
+            offset = self.get_size(name) or 0
+            if offset > size:
+                offset = 0
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            self.ftp.voidcmd('TYPE I')
+            try:
+                conn = self.ftp.transfercmd('STOR ' + name, offset or None)
+            except ftplib.error_perm:
+                if offset:
+                    # REST not supported, the next retry stores it again
+                    self.resume = False
+                raise
+            # The remote file is replaced from here, so it can be resumed
+            self.started = True
+            try:
+                while True:
+                    block = f.read(self.blocksize)
+                    if not block:
+                        break
+                    conn.sendall(block)
+            finally:
+                conn.close()
+        self.ftp.voidresp()
+        remote_size = self.get_size(name)
+        if remote_size != size:
+            raise ftplib.error_temp('Size of %s is %s, not %i bytes' %
+                                    (name, remote_size, size))
+
+    def upload(self, filename, directory, name=None):
+        """Uploads the file to the directory of the FTP home.
+
+        Returns True when the remote file has the size of the local one.
+        """
+        if name is None:
+            name = os.path.basename(filename)
+        size = os.path.getsize(filename)
+        self.started = False
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                ftp = self.connect()
+                ftp.cwd(self.home)
+                ftp.cwd(directory)
+                self.store(filename, name, size, self.started)
+                return True
+            except ftplib.all_errors, error:
+                print 'Upload of %s failed:' % name, repr(error)
+                self.close()
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay *= 2
+        return False
+
+
+class TransferPool():
+    """Uploads the files concurrently with a pool of FTP connections.
+
+    The files are taken in order by the connections, so the first ones are
+    stored first. A connection stops taking files when one fails.
+    """
+    def __init__(self, host, user='anonymous', password='anonymous@',
+                 connections=2, **options):
+        self.transfers = [FTPTransfer(host, user, password, **options)
+                          for k in range(connections)]
+
+    def upload_files(self, filenames, directory):
+        """Uploads the files and returns the ones not uploaded."""
+        queue = Queue.Queue()
+        for filename in filenames:
+            queue.put(filename)
+        uploaded = set()
+
+        def upload(transfer):
+            while True:
+                try:
+                    filename = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                if not transfer.upload(filename, directory):
+                    return
+                uploaded.add(filename)
+
+        threads = [threading.Thread(target=upload, args=(transfer,))
+                   for transfer in self.transfers[:len(filenames)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [filename for filename in filenames if filename not in uploaded]
+
+    def close(self):
+        for transfer in self.transfers:
+            transfer.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 2:
+        host, filenames = sys.argv[1], sys.argv[2:]
+    else:
+        host, filenames = '192.168.30.4', ['etna.mod']
+
+    pool = TransferPool(host)
+    t0 = time.time()
+    failed = pool.upload_files(filenames, 'ETNA')
+    t1 = time.time()
+    pool.close()
+    print 'Uploaded %i files in %.3f s' % (len(filenames) - len(failed),
+                                           t1 - t0)
+    print 'Failed:', failed
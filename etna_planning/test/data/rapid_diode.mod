@@ -0,0 +1,75 @@
+MODULE Etna
+
+    PERS tooldata toolEtna:=[TRUE,[[530.0,46.8,126.6],[0.707107,0.000000,0.707107,0.000000]],[20,[70,30,123.5],[0,0,1,0],1,0,1]];
+    PERS wobjdata wobjEtna:=[FALSE,TRUE,"",[[1655.0,-87.0,932.0],[1.000000,0.000000,0.000000,0.000000]],[[0,0,0],[1,0,0,0]]];
+
+    VAR triggdata laserON;
+    VAR triggdata laserOFF;
+
+    CONST speeddata vl:=[8,500,5000,1000];
+
+    
+    CONST robtarget T0:=[[0.000000,0.000000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T1:=[[10.125000,0.000000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T2:=[[10.125000,5.250000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T3:=[[0.000000,5.250000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T4:=[[0.000000,10.000000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T5:=[[12.500000,10.000000,0.500000],[0.707107,0.000000,0.707107,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T6:=[[12.500000,10.000000,1.000000],[1.000000,0.000000,0.000000,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T7:=[[-3.333333,2.000000,1.000000],[1.000000,0.000000,0.000000,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+    CONST robtarget T8:=[[4.000000,-2.750000,1.000000],[1.000000,0.000000,0.000000,0.000000],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]];
+
+PROC cladding()
+    !Reset doLDLStartST;
+
+    TriggL T0,v50,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T1,vl,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T2,vl,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T3,vl,laserOFF,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T4,v50,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T5,vl,laserOFF,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T6,v50,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T7,vl,laserON,z0,toolEtna\WObj:=wobjEtna;
+    TriggL T8,vl,laserOFF,z0,toolEtna\WObj:=wobjEtna;
+
+    Reset doLDLStartST;
+ENDPROC
+
+PROC mainEtna()
+    Set doLDLExtern;
+    Set doLDLRequest;
+    Set doLDLLaserON;
+    WaitDI diLDLLaserON,1;
+    Set doLDLStandBy;
+
+    SetGO GoLDL_Prog, 5;
+    WaitTime 1;
+    SetGO GoLDL_Pwr3, 1200;
+
+    TriggIO laserON, 0\DOp:=doLDLStartST, 1;
+    TriggIO laserOFF, 0\DOp:=doLDLStartST, 0;
+
+    Set DoWeldGas;
+    !MedicoatL2 "OFF", 5, 20, 7.5;
+    MedicoatL1 "OFF", 5, 20, 15;
+
+    MoveJ [[0.0,0.0,100.0],[0.0,0.0,1.0,0.0],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]],v80,z0,toolEtna\WObj:=wobjEtna;
+
+    ConfL \Off;
+
+    cladding;
+
+    MoveJ [[0.0,0.0,100.0],[0.0,0.0,1.0,0.0],[0,0,-1,0],[9E+09,9E+09,9E+09,9E+09,9E+09,9E+09]],v80,z0,toolEtna\WObj:=wobjEtna;
+
+    Reset doMdtPL2On;
+    Reset doMdtPL1On;
+    Reset DoWeldGas;
+
+    Reset doLDLStandBy;
+    Reset doLDLLaserON;
+    Reset doLDLRequest;
+    Reset doLDLExtern;
+
+ENDPROC
+
+ENDMODULE
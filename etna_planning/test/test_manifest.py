@@ -0,0 +1,116 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+from manifest import (get_manifest_name, load_manifest, save_manifest,
+                      write_modules)
+from rapid import ABB_Robot
+from toolpath import ToolPath
+
+
+def get_layers(n_layers=10, n_points=20):
+    """Returns the paths of a job of circular layers."""
+    layers = []
+    for k in range(n_layers):
+        path = ToolPath()
+        for i in range(n_points):
+            angle = 2 * np.pi * i / n_points
+            path.append([10 * np.cos(angle), 10 * np.sin(angle), 0.5 * k],
+                        [0, 0, 0, 1], i > 0, k)
+        layers.append(path)
+    return layers
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'etna.mod')
+        self.robot = ABB_Robot()
+        self.robot.max_targets = 50
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, layers):
+        filenames, changed, manifest = write_modules(self.robot,
+                                                     self.filename, layers)
+        save_manifest(get_manifest_name(self.filename), manifest)
+        return filenames, [os.path.basename(name) for name in changed]
+
+    def test_parts(self):
+        layers = get_layers()
+        filenames, changed = self.write(layers)
+        self.assertEqual(len(filenames), 6)
+        self.assertEqual(changed, ['etna.mod'] + ['EtnaPart%i.mod' % k
+                                                  for k in range(1, 6)])
+        for filename in filenames:
+            self.assertTrue(os.path.exists(filename))
+
+    def test_same(self):
+        self.write(get_layers())
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, [])
+
+    def test_layer(self):
+        self.write(get_layers())
+        layers = get_layers()
+        layers[4].positions[:, 2] += 0.1
+        filenames, changed = self.write(layers)
+        self.assertEqual(changed, ['EtnaPart3.mod'])
+
+    def test_process_parameters(self):
+        # Only written in the main module, which declares the speeddata
+        self.write(get_layers())
+        self.robot.power = 1500
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, ['etna.mod'])
+        self.robot.track_speed = 10
+        self.robot.carrier_gas = 4
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, ['etna.mod'])
+
+    def test_part_parameters(self):
+        self.write(get_layers())
+        self.robot.travel_speed = 'v100'
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(len(changed), 6)
+
+    def test_missing_file(self):
+        filenames, changed = self.write(get_layers())
+        os.remove(filenames[2])
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, ['EtnaPart2.mod'])
+
+    def test_main_module(self):
+        self.robot.max_targets = 10000
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(filenames, [self.filename])
+        self.assertEqual(changed, ['etna.mod'])
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, [])
+        self.robot.power = 1500
+        filenames, changed = self.write(get_layers())
+        self.assertEqual(changed, ['etna.mod'])
+
+    def test_manifest(self):
+        self.write(get_layers())
+        manifest = load_manifest(get_manifest_name(self.filename))
+        self.assertEqual(len(manifest['layers']), 10)
+        self.assertEqual(sorted(manifest['modules']),
+                         ['EtnaPart%i.mod' % k for k in range(1, 6)] +
+                         ['etna.mod'])
+        with open(get_manifest_name(self.filename), 'w') as f:
+            f.write('{')
+        self.assertEqual(load_manifest(get_manifest_name(self.filename)), {})
+        self.assertEqual(load_manifest(os.path.join(self.directory,
+                                                    'missing.json')), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+from mesh import Mesh, chain_segments
+
+
+def get_points(points, z_level=0.0):
+    points = np.array(points, dtype=np.float64)
+    return np.column_stack((points, np.ones(len(points)) * z_level))
+
+
+def get_segments(points, indexes, flipped=()):
+    """Returns the segments from each point index to the next one."""
+    segments = []
+    for k in indexes:
+        segment = [points[k], points[k + 1]]
+        if k in flipped:
+            segment = segment[::-1]
+        segments.append(segment)
+    return np.array(segments)
+
+
+class TestChainSegments(unittest.TestCase):
+    def assertChain(self, chain, points):
+        if not np.allclose(chain, points):
+            self.assertTrue(np.allclose(chain[::-1], points))
+
+    def test_empty(self):
+        self.assertEqual(chain_segments(np.zeros((0, 2, 3))), ([], []))
+
+    def test_closed(self):
+        points = get_points([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]])
+        segments = get_segments(points, [2, 0, 3, 1], flipped=[3])
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(chains, [])
+        self.assertEqual(len(polygons), 1)
+        polygon = polygons[0]
+        self.assertEqual(len(polygon), 5)
+        self.assertTrue(np.array_equal(polygon[0], polygon[-1]))
+        self.assertEqual(len(set(map(tuple, polygon[:-1]))), 4)
+
+    def test_open(self):
+        points = get_points([[0, 0], [1, 0], [2, 0], [3, 1]])
+        segments = get_segments(points, [1, 2, 0], flipped=[2])
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(polygons, [])
+        self.assertEqual(len(chains), 1)
+        self.assertChain(chains[0], points)
+
+    def test_open_from_middle(self):
+        points = get_points([[0, 0], [1, 0], [2, 0], [3, 1], [4, 1], [5, 2]])
+        segments = get_segments(points, [2, 4, 0, 3, 1], flipped=[0, 4])
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(polygons, [])
+        self.assertEqual(len(chains), 1)
+        self.assertChain(chains[0], points)
+
+    def test_open_and_closed(self):
+        square = get_points([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]])
+        line = get_points([[5, 0], [6, 0], [7, 0]])
+        segments = np.vstack((get_segments(line, [1]),
+                              get_segments(square, [0, 1, 2, 3]),
+                              get_segments(line, [0])))
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(len(polygons), 1)
+        self.assertEqual(len(polygons[0]), 5)
+        self.assertEqual(len(chains), 1)
+        self.assertChain(chains[0], line)
+
+    def test_two_open(self):
+        line1 = get_points([[0, 0], [1, 0], [2, 0]])
+        line2 = get_points([[0, 5], [1, 5], [2, 5]])
+        segments = np.vstack((get_segments(line1, [0]),
+                              get_segments(line2, [1, 0]),
+                              get_segments(line1, [1])))
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(polygons, [])
+        self.assertEqual(len(chains), 2)
+        chains.sort(key=lambda chain: chain[0, 1])
+        self.assertChain(chains[0], line1)
+        self.assertChain(chains[1], line2)
+
+    def test_tolerance(self):
+        points = get_points([[0, 0], [1, 0], [2, 0]])
+        segments = get_segments(points, [0, 1])
+        segments[1, 0] += 1e-7
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(len(chains), 1)
+        self.assertEqual(len(chains[0]), 3)
+        polygons, chains = chain_segments(segments, tolerance=1e-9)
+        self.assertEqual(len(chains), 2)
+
+    def test_keys(self):
+        points = get_points([[0, 0], [1, 0], [2, 0]])
+        segments = get_segments(points, [1, 0])
+        # End points matched by their mesh edges, not their coordinates
+        segments[0, 0] += 0.5
+        keys = np.array([[1, 2], [0, 1]])
+        polygons, chains = chain_segments(segments, keys)
+        self.assertEqual(len(chains), 1)
+        self.assertEqual(len(chains[0]), 3)
+
+    def test_degenerated(self):
+        points = get_points([[0, 0], [1, 0], [2, 0]])
+        segments = np.vstack((get_segments(points, [0, 1]),
+                              [[points[1], points[1]]]))
+        polygons, chains = chain_segments(segments)
+        self.assertEqual(len(chains), 1)
+        self.assertChain(chains[0], points)
+
+
+class TestSlice(unittest.TestCase):
+    def test_degenerated(self):
+        # Collinear triangle spanning the level, without area in the slice
+        mesh = Mesh(None)
+        mesh.triangles = np.array([[[0, 0, 0], [1, 0, 0.5], [2, 0, 1]]],
+                                  dtype=np.float32)
+        self.assertEqual(mesh.get_slice(0.25), None)
+
+    def test_empty(self):
+        mesh = Mesh(None)
+        mesh.triangles = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 1]]],
+                                  dtype=np.float32)
+        self.assertEqual(mesh.get_slice(2.0), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
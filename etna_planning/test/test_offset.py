@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+from offset import get_offsets, get_signed_area, offset_polygons
+
+
+def get_polygon(points, z_level=1.0):
+    points = np.array(points, dtype=np.float64)
+    return np.column_stack((points, np.ones(len(points)) * z_level))
+
+
+SQUARE = get_polygon([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+OUTER = get_polygon([[0, 0], [20, 0], [20, 20], [0, 20], [0, 0]])
+HOLE = get_polygon([[5, 5], [15, 5], [15, 15], [5, 15], [5, 5]])
+U_SHAPE = get_polygon([[0, 0], [30, 0], [30, 20], [20, 20], [20, 4],
+                       [10, 4], [10, 20], [0, 20], [0, 0]])
+
+
+class TestOffset(unittest.TestCase):
+    def test_square(self):
+        polygons = offset_polygons([SQUARE], 1.0)
+        self.assertEqual(len(polygons), 1)
+        polygon = polygons[0]
+        self.assertTrue(np.array_equal(polygon[0], polygon[-1]))
+        self.assertAlmostEqual(get_signed_area(polygon), 64.0)
+        self.assertTrue(np.allclose(np.min(polygon, axis=0), [1, 1, 1]))
+        self.assertTrue(np.allclose(np.max(polygon, axis=0), [9, 9, 1]))
+
+    def test_square_clockwise(self):
+        polygons = offset_polygons([SQUARE[::-1]], 1.0)
+        self.assertEqual(len(polygons), 1)
+        self.assertAlmostEqual(get_signed_area(polygons[0]), 64.0)
+
+    def test_hole(self):
+        polygons = offset_polygons([OUTER, HOLE], 1.0)
+        self.assertEqual(len(polygons), 2)
+        areas = sorted([get_signed_area(polygon) for polygon in polygons])
+        # The hole grows with round corners, outer turns CCW and hole CW
+        self.assertAlmostEqual(areas[0], -(144 - (4 - np.pi)), delta=0.05)
+        self.assertAlmostEqual(areas[1], 324.0)
+
+    def test_hole_closed(self):
+        self.assertEqual(offset_polygons([OUTER, HOLE], 3.0), [])
+
+    def test_u_shape(self):
+        polygons = offset_polygons([U_SHAPE], 1.0)
+        self.assertEqual(len(polygons), 1)
+        # Eroded area: 6 convex corners and 2 round reflex ones
+        area = 440 - 132 + 6 - np.pi / 2
+        self.assertAlmostEqual(get_signed_area(polygons[0]), area,
+                               delta=0.05)
+
+    def test_u_shape_split(self):
+        polygons = offset_polygons([U_SHAPE], 3.0)
+        self.assertEqual(len(polygons), 2)
+        for polygon in polygons:
+            self.assertAlmostEqual(get_signed_area(polygon), 56.0, delta=0.1)
+        x_values = sorted([np.min(polygon[:, 0]) for polygon in polygons])
+        self.assertAlmostEqual(x_values[0], 3.0)
+        self.assertTrue(x_values[1] > 20.0)
+
+    def test_offsets(self):
+        offsets = get_offsets([SQUARE], 1.0, 10)
+        self.assertEqual(len(offsets), 4)
+        areas = [get_signed_area(polygons[0]) for polygons in offsets]
+        for area, size in zip(areas, [8, 6, 4, 2]):
+            self.assertAlmostEqual(area, size ** 2)
+
+    def test_offsets_cache(self):
+        cache = {}
+        offsets = get_offsets([SQUARE], 1.0, 2, cache=cache)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(get_offsets([SQUARE], 1.0, 2, cache=cache) is offsets)
+
+
+if __name__ == '__main__':
+    unittest.main()
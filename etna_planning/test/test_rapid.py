@@ -0,0 +1,104 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+import rapid
+import rapid_arrays
+import rapid_diode
+from toolpath import ToolPath
+
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+QUATERNION = [0.0, 0.70710678, 0.0, 0.70710678]
+# Path of the modules in data, written by the baseline emitters
+PATH = [[[0.0, 0.0, 0.5], QUATERNION, False],
+        [[10.125, 0.0, 0.5], QUATERNION, True],
+        [[10.125, 5.25, 0.5], QUATERNION, True],
+        [[0.0, 5.25, 0.5], QUATERNION, True],
+        [[0.0, 10.0, 0.5], QUATERNION, False],
+        [[12.5, 10.0, 0.5], QUATERNION, True],
+        [[12.5, 10.0, 1.0], [0.0, 0.0, 0.0, 1.0], False],
+        [[-3.333333, 2.0, 1.0], [0.0, 0.0, 0.0, 1.0], True],
+        [[4.0, -2.75, 1.0], [0.0, 0.0, 0.0, 1.0], True]]
+
+
+def get_layers():
+    """Returns the path in two layers of tool paths."""
+    path = ToolPath(PATH)
+    path.layers[6:] = 1
+    return path.split_layers()
+
+
+def read_module(name):
+    with open(os.path.join(DATA, name), 'rb') as f:
+        return f.read()
+
+
+class TestRapid(unittest.TestCase):
+    def setUp(self):
+        self.modules = [(rapid.ABB_Robot(), read_module('rapid.mod')),
+                        (rapid_diode.ABB_Robot(),
+                         read_module('rapid_diode.mod'))]
+
+    def test_list(self):
+        for robot, module in self.modules:
+            self.assertEqual(robot.path2rapid(PATH), module)
+
+    def test_toolpath(self):
+        for robot, module in self.modules:
+            self.assertEqual(robot.path2rapid(ToolPath(PATH)), module)
+
+    def test_layers(self):
+        for robot, module in self.modules:
+            f = StringIO()
+            robot.write_module(f, [[]] + get_layers() + [[]])
+            self.assertEqual(f.getvalue(), module)
+
+    def test_write_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'etna.mod')
+            for robot, module in self.modules:
+                robot.write_file(filename, get_layers())
+                with open(filename, 'rb') as f:
+                    self.assertEqual(f.read(), module)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_write_file_error(self):
+        robot = rapid.ABB_Robot()
+        filename = os.path.join(DATA, 'missing', 'etna.mod')
+        self.assertRaises(IOError, robot.write_file, filename, [PATH])
+
+
+class TestRapidArrays(unittest.TestCase):
+    def test_runs(self):
+        runs = rapid_arrays.get_runs(get_layers()[0])
+        self.assertEqual(runs.tolist(), [[1, 4, 1], [5, 6, 1]])
+        path = ToolPath(PATH[1:4])
+        self.assertEqual(rapid_arrays.get_runs(path).tolist(), [[1, 3, 0]])
+
+    def test_moves(self):
+        # The array module runs the same moves as the baseline one
+        for robot, name in [(rapid.ABB_Robot(), 'rapid.mod'),
+                            (rapid_diode.ABB_Robot(), 'rapid_diode.mod')]:
+            module = rapid_arrays.paths2rapid(robot, get_layers())
+            moves1 = rapid_arrays.parse_module(read_module(name))
+            moves2 = rapid_arrays.parse_module(module)
+            self.assertTrue(np.array_equal(moves1[0], moves2[0]))
+            self.assertTrue(np.array_equal(moves1[1], moves2[1]))
+            self.assertEqual(moves1[2], moves2[2])
+            self.assertEqual(moves1[3], moves2[3])
+            self.assertEqual(len(moves1[0]), len(PATH))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+from toolpath import ToolPath, iter_parts
+
+
+def get_path(processes, x_start=0):
+    """Returns a path along X with a point for each process flag."""
+    path = ToolPath()
+    for k, process in enumerate(processes):
+        path.append([x_start + k, 0, 0], [0, 0, 0, 1], process)
+    return path
+
+
+class TestIterParts(unittest.TestCase):
+    def get_parts(self, paths, max_points):
+        parts = list(iter_parts(paths, max_points))
+        for part in parts:
+            self.assertTrue(0 < sum([len(piece) for piece in part]) <=
+                            max_points)
+        return parts
+
+    def test_min_points(self):
+        for max_points in [-1, 0, 1]:
+            self.assertRaises(ValueError, list,
+                              iter_parts([get_path([False, True])],
+                                         max_points))
+
+    def test_empty(self):
+        self.assertEqual(list(iter_parts([], 10)), [])
+
+    def test_exact_fit(self):
+        paths = [get_path([False] + [True] * 4) for k in range(2)]
+        parts = self.get_parts(paths, 10)
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(len(parts[0]), 2)
+
+    def test_one_over(self):
+        paths = [get_path([False] + [True] * 4),
+                 get_path([False] + [True] * 5)]
+        parts = self.get_parts(paths, 10)
+        self.assertEqual([len(part) for part in parts], [1, 1])
+        self.assertEqual(len(parts[1][0]), 6)
+
+    def test_split_at_runs(self):
+        processes = [False, True, True, False, True, True, False, True]
+        path = get_path(processes)
+        parts = self.get_parts([path], 5)
+        pieces = [piece for part in parts for piece in part]
+        self.assertEqual([len(piece) for piece in pieces], [3, 5])
+        for piece in pieces:
+            self.assertFalse(piece.processes[0])
+        positions = np.vstack([piece.positions for piece in pieces])
+        self.assertTrue(np.array_equal(positions, path.positions))
+
+    def test_split_long_run(self):
+        path = get_path([False] + [True] * 9)
+        parts = self.get_parts([path], 4)
+        pieces = [piece for part in parts for piece in part]
+        self.assertEqual([len(piece) for piece in pieces], [4, 4, 4])
+        for piece1, piece2 in zip(pieces[:-1], pieces[1:]):
+            # The last point is repeated as the travel to the next part
+            self.assertTrue(np.array_equal(piece1.positions[-1],
+                                           piece2.positions[0]))
+            self.assertFalse(piece2.processes[0])
+            self.assertTrue(np.all(piece2.processes[1:]))
+        # The path is not changed by the travel points of the parts
+        self.assertTrue(np.all(path.processes[1:]))
+
+    def test_two_points(self):
+        path = get_path([False] + [True] * 5)
+        parts = self.get_parts([path], 2)
+        self.assertEqual(len(parts), 5)
+        positions = np.vstack([part[0].positions[1:] for part in parts])
+        self.assertTrue(np.array_equal(positions, path.positions[1:]))
+
+    def test_split_starts_new_part(self):
+        paths = [get_path([False, True, True]),
+                 get_path([False] + [True] * 7, 10)]
+        parts = self.get_parts(paths, 5)
+        self.assertEqual(len(parts[0]), 1)
+        self.assertEqual(len(parts[0][0]), 3)
+        self.assertEqual(parts[1][0].positions[0, 0], 10)
+
+    def test_lists(self):
+        path = get_path([False, True, True])
+        points = [[position, orientation, process]
+                  for position, orientation, process in path]
+        parts = self.get_parts([points], 10)
+        self.assertTrue(isinstance(parts[0][0], ToolPath))
+        self.assertTrue(np.array_equal(parts[0][0].positions,
+                                       path.positions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import unittest
+import threading
+import SocketServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'robpath'))
+
+from transfer import FTPTransfer, TransferPool
+
+
+class FTPHandler(SocketServer.StreamRequestHandler):
+    """Stand-in FTP server storing the files in the server root.
+
+    It drops the session after drop_after[name] bytes of the next STOR of
+    the file, and answers SIZE only when it is supported.
+    """
+    def send(self, line):
+        self.wfile.write(line + '\r\n')
+        self.wfile.flush()
+
+    def get_path(self, cwd, name):
+        path = os.path.normpath(os.path.join(cwd, name)).lstrip('/')
+        return os.path.join(self.server.root, path)
+
+    def handle(self):
+        server = self.server
+        cwd, rest, pasv = '/', 0, None
+        self.send('220 stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, arg = line.strip().partition(' ')
+            command = command.upper()
+            path = self.get_path(cwd, arg)
+            if command in ('USER', 'PASS'):
+                self.send('230 ok' if command == 'PASS' else '331 ok')
+            elif command == 'PWD':
+                self.send('257 "%s"' % cwd)
+            elif command == 'CWD':
+                if os.path.isdir(path):
+                    cwd = os.path.normpath(os.path.join(cwd, arg))
+                    self.send('250 ok')
+                else:
+                    self.send('550 no directory')
+            elif command in ('TYPE', 'NOOP'):
+                self.send('200 ok')
+            elif command == 'PASV':
+                pasv = socket.socket()
+                pasv.bind(('127.0.0.1', 0))
+                pasv.listen(1)
+                port = pasv.getsockname()[1]
+                self.send('227 Entering Passive Mode (127,0,0,1,%i,%i)' %
+                          (port >> 8, port & 255))
+            elif command == 'REST':
+                rest = int(arg)
+                server.rests.append(rest)
+                self.send('350 ok')
+            elif command == 'SIZE' and server.size:
+                if os.path.isfile(path):
+                    self.send('213 %i' % os.path.getsize(path))
+                else:
+                    self.send('550 no file')
+            elif command == 'LIST':
+                self.send('150 ok')
+                conn, address = pasv.accept()
+                pasv.close()
+                if os.path.isfile(path):
+                    conn.sendall('-rw-r--r-- 1 user group %i Jan 1 00:00 %s\r\n'
+                                 % (os.path.getsize(path), arg))
+                conn.close()
+                self.send('226 ok')
+            elif command == 'STOR':
+                self.send('150 ok')
+                conn, address = pasv.accept()
+                pasv.close()
+                limit = server.drop_after.pop(arg, None)
+                with open(path, 'r+b' if rest else 'wb') as f:
+                    f.seek(rest)
+                    f.truncate()
+                    n_bytes = 0
+                    while True:
+                        data = conn.recv(4096)
+                        if not data:
+                            break
+                        if limit is not None and n_bytes + len(data) > limit:
+                            f.write(data[:limit - n_bytes])
+                            conn.close()
+                            return
+                        f.write(data)
+                        n_bytes += len(data)
+                conn.close()
+                rest = 0
+                self.send('226 ok')
+            elif command == 'QUIT':
+                self.send('221 bye')
+                return
+            else:
+                self.send('502 not implemented')
+
+
+class FTPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local = os.path.join(self.directory, 'local')
+        os.makedirs(self.local)
+        os.makedirs(os.path.join(self.directory, 'remote', 'ETNA'))
+        self.server = FTPServer(('127.0.0.1', 0), FTPHandler)
+        self.server.root = os.path.join(self.directory, 'remote')
+        self.server.drop_after = {}
+        self.server.rests = []
+        self.server.size = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, data):
+        filename = os.path.join(self.local, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def read_remote(self, name):
+        with open(os.path.join(self.server.root, 'ETNA', name), 'rb') as f:
+            return f.read()
+
+    def get_transfer(self, retries=2):
+        return FTPTransfer('127.0.0.1', port=self.port, retries=retries,
+                           backoff=0.01)
+
+    def test_upload_files(self):
+        filenames = [self.write_file('EtnaPart%i.mod' % k, os.urandom(20000))
+                     for k in range(5)]
+        pool = TransferPool('127.0.0.1', port=self.port, backoff=0.01)
+        self.assertEqual(pool.upload_files(filenames, 'ETNA'), [])
+        pool.close()
+        for filename in filenames:
+            with open(filename, 'rb') as f:
+                self.assertEqual(self.read_remote(os.path.basename(filename)),
+                                 f.read())
+
+    def test_resume(self):
+        data = os.urandom(100000)
+        filename = self.write_file('etna.mod', data)
+        self.server.drop_after['etna.mod'] = 30000
+        transfer = self.get_transfer()
+        self.assertTrue(transfer.upload(filename, 'ETNA'))
+        transfer.close()
+        self.assertEqual(self.server.rests, [30000])
+        self.assertEqual(self.read_remote('etna.mod'), data)
+
+    def test_new_version_not_resumed(self):
+        filename = self.write_file('etna.mod', 'a' * 1000)
+        self.server.drop_after['etna.mod'] = 750
+        transfer = self.get_transfer(retries=0)
+        self.assertFalse(transfer.upload(filename, 'ETNA'))
+        filename = self.write_file('etna.mod', 'b' * 1000)
+        self.assertTrue(transfer.upload(filename, 'ETNA'))
+        transfer.close()
+        self.assertEqual(self.server.rests, [])
+        self.assertEqual(self.read_remote('etna.mod'), 'b' * 1000)
+
+    def test_list_size(self):
+        self.server.size = False
+        filename = self.write_file('etna.mod', os.urandom(5000))
+        transfer = self.get_transfer()
+        self.assertTrue(transfer.upload(filename, 'ETNA'))
+        self.assertEqual(transfer.get_size('etna.mod'), 5000)
+        self.assertEqual(transfer.get_size('missing.mod'), None)
+        transfer.close()
+
+    def test_connection_refused(self):
+        filename = self.write_file('etna.mod', 'data')
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        transfer = FTPTransfer('127.0.0.1', port=port, retries=1,
+                               backoff=0.01)
+        self.assertFalse(transfer.upload(filename, 'ETNA'))
+
+
+if __name__ == '__main__':
+    unittest.main()